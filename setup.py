@@ -17,7 +17,8 @@ setup(
         'click',
         'dash',
         'plotly',
-        'pandas',
+        # snapshots hand out shallow copies and rely on copy-on-write, the default from pandas 3
+        'pandas>=3',
         'numpy'
     ],
     extras_require={
@@ -4,7 +4,13 @@ from datetime import date
 from dateutil.relativedelta import relativedelta
 import click
 import yaml
+from .batch import BatchProjector
+from .checkpoint import Checkpoint
+from .goalseek import GoalSeek, Variable, Constraint
+from .importer import TransactionImporter
+from .linear import LinearProjection
 from .projector import Projector
+from .server import QueryService, QueryServer
 from .datespec import DATE_FORMAT
 from .dash_app import create_app
 
@@ -35,15 +41,134 @@ def cli():
               default=str(date.today()), help='Start date.')
 @click.option('--end-date', type=click.DateTime(formats=[DATE_FORMAT]), required=True,
               default=str(date.today() + relativedelta(years=1)), help='End date.')
-def dash(start_date, end_date):
+@click.option('--actuals', type=click.Path(exists=True, dir_okay=False), multiple=True,
+              help='CSV export of actual transactions. May be repeated.')
+@click.option('--cutoff', type=click.DateTime(formats=[DATE_FORMAT]), required=True,
+              default=str(date.today()), help='Projected transactions before this date are replaced by actuals.')
+@click.option('--checkpoint', 'checkpoint_file', type=click.Path(exists=True, dir_okay=False),
+              help='Resume from a checkpoint file. --start-date and --actuals are ignored.')
+@click.option('--store', 'store_dir', type=click.Path(file_okay=False),
+              help='Memory mapped projection store shared by workers. Written on first run, reused while the spec '
+                   'and dates are unchanged.')
+@click.option('--webgl-threshold', type=int, default=None,
+              help='Draw line traces with more points than this with WebGL.')
+def dash(start_date, end_date, actuals, cutoff, checkpoint_file, store_dir, webgl_threshold):
     spec = get_yaml()
-    projector = Projector.from_spec(spec,
-                                    start_date.strftime(DATE_FORMAT),
-                                    end_date.strftime(DATE_FORMAT))
+    start_date = start_date.strftime(DATE_FORMAT)
+    end_date = end_date.strftime(DATE_FORMAT)
+    if store_dir:
+        projector = Projector.from_store(spec, start_date, end_date, store_dir)
+    elif checkpoint_file:
+        projector = Projector.from_checkpoint(spec, Checkpoint.load(checkpoint_file), end_date)
+    else:
+        actuals_df = None
+        if actuals:
+            importer = TransactionImporter.from_spec(spec, start_date, end_date)
+            actuals_df = importer.read_csv_files(actuals)
+        projector = Projector.from_spec(spec, start_date, end_date, actuals=actuals_df,
+                                        cutoff=cutoff.strftime(DATE_FORMAT))
     charts = projector.get_charts()
-    app = create_app(*charts)
+    accounts = {a.account_id: a.name for a in projector.get_snapshot().accounts.values()}
+    app = create_app(*charts, search=projector.search, accounts=accounts, webgl_threshold=webgl_threshold)
     app.run_server(debug=True, extra_files=get_watch_files())
 
 
+@cli.command(help='Write account state as of a date to a checkpoint file')
+@click.option('--start-date', type=click.DateTime(formats=[DATE_FORMAT]), required=True,
+              default=str(date.today()), help='Start date. Ignored with --from-checkpoint.')
+@click.option('--date', 'checkpoint_date', type=click.DateTime(formats=[DATE_FORMAT]), required=True,
+              default=str(date.today()), help='Checkpoint date.')
+@click.option('--from-checkpoint', type=click.Path(exists=True, dir_okay=False),
+              help='Only process the days after this checkpoint.')
+@click.option('--output', type=click.Path(dir_okay=False), required=True,
+              default='balance-projector.checkpoint.yml', help='Checkpoint file to write.')
+def checkpoint(start_date, checkpoint_date, from_checkpoint, output):
+    spec = get_yaml()
+    checkpoint_date = checkpoint_date.strftime(DATE_FORMAT)
+    if from_checkpoint:
+        projector = Projector.from_checkpoint(spec, Checkpoint.load(from_checkpoint), checkpoint_date)
+    else:
+        projector = Projector.from_spec(spec, start_date.strftime(DATE_FORMAT), checkpoint_date)
+    projector.checkpoint(checkpoint_date).save(output)
+    click.echo(f'Wrote checkpoint for {checkpoint_date} to {output}')
+
+
+def parse_balance_bounds(values, param_name):
+    bounds = {}
+    for value in values:
+        account_id, sep, amount = value.partition('=')
+        try:
+            bounds[account_id] = float(amount)
+        except ValueError:
+            raise click.BadParameter(f'Expected ACCOUNT_ID=AMOUNT. Received: {value}', param_hint=param_name)
+    return bounds
+
+
+@cli.command(name='goal-seek', help='Find scheduled amounts that keep balances within bounds')
+@click.option('--start-date', type=click.DateTime(formats=[DATE_FORMAT]), required=True,
+              default=str(date.today()), help='Start date.')
+@click.option('--end-date', type=click.DateTime(formats=[DATE_FORMAT]), required=True,
+              default=str(date.today() + relativedelta(years=1)), help='End date.')
+@click.option('--variable', 'variables', multiple=True, required=True,
+              help='ACCOUNT_ID.TRANSACTION_ID:LOWER:UPPER[:max|min]. May be repeated.')
+@click.option('--min-balance', multiple=True, help='ACCOUNT_ID=AMOUNT. May be repeated.')
+@click.option('--max-balance', multiple=True, help='ACCOUNT_ID=AMOUNT. May be repeated.')
+@click.option('--tolerance', type=float, default=0.01, show_default=True, help='Bisection tolerance.')
+def goal_seek(start_date, end_date, variables, min_balance, max_balance, tolerance):
+    spec = get_yaml()
+    try:
+        variables = [Variable.from_str(v) for v in variables]
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--variable')
+    mins = parse_balance_bounds(min_balance, '--min-balance')
+    maxes = parse_balance_bounds(max_balance, '--max-balance')
+    constraints = [Constraint(account_id=a, min_balance=mins.get(a), max_balance=maxes.get(a))
+                   for a in sorted(set(mins) | set(maxes))]
+    projection = LinearProjection.from_spec(spec, start_date.strftime(DATE_FORMAT), end_date.strftime(DATE_FORMAT))
+    result = GoalSeek(projection=projection, variables=variables, constraints=constraints,
+                      tolerance=tolerance).solve()
+    for (account_id, transaction_id), amount in result.amounts.items():
+        click.echo(f'{account_id}.{transaction_id}: {amount:.2f}')
+    click.echo(f'feasible: {result.feasible} ({result.evaluations} evaluations)')
+
+
+@cli.command(help='Project every spec file in a directory')
+@click.argument('directory', type=click.Path(exists=True, file_okay=False))
+@click.option('--start-date', type=click.DateTime(formats=[DATE_FORMAT]), required=True,
+              default=str(date.today()), help='Start date.')
+@click.option('--end-date', type=click.DateTime(formats=[DATE_FORMAT]), required=True,
+              default=str(date.today() + relativedelta(years=1)), help='End date.')
+@click.option('--output', type=click.Path(file_okay=False), required=True, default='projections',
+              show_default=True, help='Directory for per-spec results and summary.csv.')
+@click.option('--workers', type=int, default=None, help='Worker processes. Defaults to the number of CPUs.')
+def batch(directory, start_date, end_date, output, workers):
+    batch_projector = BatchProjector.from_directory(directory, start_date.strftime(DATE_FORMAT),
+                                                    end_date.strftime(DATE_FORMAT), output, workers=workers)
+    report = batch_projector.run()
+    for result in report.results:
+        status = 'ok' if result.ok else f'FAILED {result.error}'
+        click.echo(f'{result.spec_file}: {result.seconds:.3f}s {status}')
+    click.echo(f'{len(report.results)} specs in {report.seconds:.2f}s ({report.throughput:.2f} specs/sec), '
+               f'{len(report.failures)} failed')
+
+
+@cli.command(help='Serve the projection as a local JSON API')
+@click.option('--start-date', type=click.DateTime(formats=[DATE_FORMAT]), required=True,
+              default=str(date.today()), help='Start date.')
+@click.option('--end-date', type=click.DateTime(formats=[DATE_FORMAT]), required=True,
+              default=str(date.today() + relativedelta(years=1)), help='End date.')
+@click.option('--host', default='127.0.0.1', show_default=True, help='Interface to bind.')
+@click.option('--port', type=int, default=8051, show_default=True, help='Port to bind.')
+@click.option('--cache-size', type=int, default=1024, show_default=True, help='Cached responses.')
+@click.option('--workers', type=int, default=None, help='Query threads.')
+def serve(start_date, end_date, host, port, cache_size, workers):
+    spec = get_yaml()
+    projector = Projector.from_spec(spec, start_date.strftime(DATE_FORMAT), end_date.strftime(DATE_FORMAT))
+    projector.publish()
+    service = QueryService.from_projector(projector, cache_size=cache_size, workers=workers)
+    click.echo(f'Serving on http://{host}:{port}/')
+    QueryServer(service=service).serve_forever(host, port)
+
+
 if __name__ == '__main__':
     cli()
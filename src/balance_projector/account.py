@@ -4,11 +4,18 @@ import attr
 import dateutil.parser as dp
 import pandas as pd
 
+from .accrual import Accrual, ACCRUAL_TRANSACTION_ID
 from .exceptions import InvalidAccountType, AccountNotFoundException, OutOfBoundsException
-from .transaction import ScheduledTransactions
+from .journal import Journal
+from .rollup import resample_balance
+from .transaction import JournalEntry, ScheduledTransactions
 
 pd.options.mode.chained_assignment = None  # no warning message and no exception is raised
 
+# Full set of ledger columns. get_transactions_df() exposes a subset of these.
+LEDGER_COLUMNS = ['transaction_id', 'type', 'account_id', 'date', 'amount', 'name', 'counterparty_id']
+TRANSACTIONS_DF_COLUMNS = ['account_id', 'date', 'amount', 'name']
+
 
 @attr.define(kw_only=True)
 class Account:
@@ -17,12 +24,33 @@ class Account:
     start_date: str = attr.ib()
     balance: float = attr.ib()
     transactions: list = attr.ib(factory=list)
+    transaction_frames: dict = attr.ib(factory=dict)
+    accrual: Union[Accrual, None] = attr.ib(default=None)
+    # interest earned before start_date but not posted yet, restored from a checkpoint
+    accrued: float = attr.ib(default=0.0)
+    journal: Union[Journal, None] = attr.ib(default=None)
     transactions_df: Union[pd.DataFrame, None] = attr.ib()
+    ledger_df: Union[pd.DataFrame, None] = attr.ib()
+    ohlc: dict = attr.ib(factory=dict)
 
     @transactions_df.default
     def _default_transactions_df(self):
         return None
 
+    @ledger_df.default
+    def _default_ledger_df(self):
+        return None
+
+    def invalidate(self):
+        """
+        Flip cached frames to None so they get rebuilt on the next request
+
+        :return:
+        """
+        self.transactions_df = None
+        self.ledger_df = None
+        self.ohlc = {}
+
     def add_transactions(self, transactions):
         for t in transactions:
             self.add_transaction(t)
@@ -36,24 +64,89 @@ class Account:
         """
         if transaction.account_id != self.account_id:
             raise ValueError(f'Expected account id: {self.account_id} Received: {transaction.account_id}')
-        self.transactions_df = None  # flip to None so it gets rebuilt on the next request
+        self.invalidate()
         self.transactions.append(transaction)
 
-    def get_transactions_df(self):
+    def set_transactions_df(self, source, df):
         """
-        Get master transactions_df
+        Attach a block of transactions that already live in a DataFrame, e.g. imported actuals.
+
+        Frames are keyed by source so a block can be replaced wholesale without touching the
+        Transaction objects. Pass None to remove the block.
+
+        :param source: str
+        :param df: pd.DataFrame|None with LEDGER_COLUMNS
+        :return:
+        """
+        if df is None:
+            self.transaction_frames.pop(source, None)
+        else:
+            if (df['account_id'] != self.account_id).any():
+                raise ValueError(f'Expected account id: {self.account_id} in transactions for source: {source}')
+            self.transaction_frames[source] = df[LEDGER_COLUMNS]
+        self.invalidate()
+
+    def get_ledger_df(self):
+        """
+        Get master ledger with every column in LEDGER_COLUMNS
 
         :return: pd.DataFrame
         """
-        if self.transactions_df is None:
+        if self.ledger_df is None:
             data = list(map(attr.asdict, self.transactions))
-            df = pd.DataFrame(data, columns=['account_id', 'date', 'amount', 'name'])
+            df = pd.DataFrame(data, columns=LEDGER_COLUMNS)
+            frames = [df, *self.transaction_frames.values()]
+            if self.journal is not None:
+                frames.append(self.journal.get_account_view(self.account_id)[LEDGER_COLUMNS])
+            frames = [f for f in frames if len(f.index) > 0]
+            if len(frames) > 1:
+                df = pd.concat(frames, ignore_index=True)
+            elif len(frames) == 1:
+                df = frames[0]
             # round amount
             df['amount'].round(decimals=2)
             df = df.sort_values(by=['date', 'name'],
                                 ascending=True,
                                 ignore_index=True)
-            self.transactions_df = df
+            self.ledger_df = df
+        return self.ledger_df
+
+    def apply_accrual(self, end_date):
+        """
+        (Re)compute summary accrual rows through end_date from everything else in the ledger
+
+        :param end_date: str
+        :return:
+        """
+        if self.accrual is None:
+            return
+        self.set_transactions_df(ACCRUAL_TRANSACTION_ID, None)
+        df = self.accrual.compute(self.account_id, self.balance, self.get_ledger_df(), self.start_date, end_date,
+                                  carried=self.accrued)
+        self.set_transactions_df(ACCRUAL_TRANSACTION_ID, df)
+
+    def get_accrued(self, date, end_date) -> float:
+        """
+        Interest earned by the end of date that the ledger doesn't show yet, see Accrual.get_pending()
+
+        :param date: str
+        :param end_date: str End of the projection, where the last accrual row posts
+        :return: float
+        """
+        if self.accrual is None:
+            return 0.0
+        ledger = self.get_ledger_df()
+        ledger = ledger[ledger['transaction_id'] != ACCRUAL_TRANSACTION_ID]
+        return self.accrual.get_pending(self.balance, ledger, self.start_date, end_date, date, carried=self.accrued)
+
+    def get_transactions_df(self):
+        """
+        Get master transactions_df
+
+        :return: pd.DataFrame
+        """
+        if self.transactions_df is None:
+            self.transactions_df = self.get_ledger_df()[TRANSACTIONS_DF_COLUMNS]
         return self.transactions_df
 
     def get_balance(self, date):
@@ -104,6 +197,22 @@ class Account:
         })
         return self.apply_running_balance(self.balance, df_date_group)
 
+    def get_balance_ohlc(self, period='monthly'):
+        """
+        Open/min/max/close balance and net flow per period, cached per period
+
+        Unlike get_running_balance_grouped() resampled to month ends, min shows the lowest balance inside each
+        period, e.g. a mid-month overdraft.
+
+        :param period: str daily|weekly|monthly|yearly
+        :return: pd.DataFrame indexed by period
+        """
+        if period not in self.ohlc:
+            df = self.get_running_balance()
+            self.ohlc[period] = resample_balance(df['date'], df['amount'], df['balance'], self.balance, period,
+                                                 self.start_date)
+        return self.ohlc[period]
+
     @classmethod
     def apply_running_balance(cls, starting_balance, trans_df):
         trans_df['balance'] = starting_balance + trans_df['amount'].cumsum()
@@ -127,7 +236,7 @@ class AccountFactory:
                                      stmt_close_dom=spec['stmt_close_dom'])
         elif acct_type in ['checking', 'savings', 'invest']:
             return Account(account_id=spec['account_id'], name=spec['name'], start_date=spec['start_date'],
-                           balance=spec['balance'])
+                           balance=spec['balance'], accrual=Accrual.from_spec(spec.get('accrual')))
         else:
             raise InvalidAccountType(f'Account type not found: {acct_type}')
 
@@ -135,6 +244,12 @@ class AccountFactory:
 @attr.define(kw_only=True)
 class Accounts:
     accounts: dict = attr.ib(factory=dict)
+    journal: Journal = attr.ib(factory=Journal)
+
+    def __attrs_post_init__(self):
+        # every account reads its transfers from the shared journal
+        for account in self.accounts.values():
+            account.journal = self.journal
 
     @classmethod
     def from_spec(cls, spec, start_date, end_date):
@@ -153,9 +268,76 @@ class Accounts:
 
     def add_transactions(self, transactions: list) -> None:
         for t in transactions:
+            if isinstance(t, JournalEntry):
+                self.add_journal_entry(t)
+                continue
             account = self.get_account(t.account_id)
             account.add_transaction(t)
 
+    def add_journal_entry(self, entry: JournalEntry) -> None:
+        sending = self.get_account(entry.from_account_id)
+        receiving = self.get_account(entry.to_account_id)
+        self.journal.add(entry)
+        sending.invalidate()
+        receiving.invalidate()
+
+    def get_ledger_df(self) -> pd.DataFrame:
+        """
+        Ledgers of every account stacked, sorted by date
+
+        :return: pd.DataFrame with LEDGER_COLUMNS
+        """
+        ledgers = [a.get_ledger_df() for a in self.accounts.values() if len(a.get_ledger_df().index) > 0]
+        if len(ledgers) == 0:
+            return pd.DataFrame(columns=LEDGER_COLUMNS)
+        return pd.concat(ledgers, ignore_index=True).sort_values('date', kind='stable', ignore_index=True)
+
+    def get_journal_df(self) -> pd.DataFrame:
+        """
+        One row per posting event: transfers from the journal, everything else against the external pseudo-account
+
+        :return: pd.DataFrame with JOURNAL_COLUMNS
+        """
+        return Journal.combine_ledger(self.get_ledger_df(), self.journal.get_journal_df())
+
+    def check_balanced(self) -> pd.DataFrame:
+        """
+        See Journal.check_balanced()
+
+        :return: pd.DataFrame empty when every posting event nets to zero
+        """
+        return Journal.check_balanced(self.get_ledger_df())
+
+    def apply_accruals(self, end_date) -> None:
+        for account in self.accounts.values():
+            account.apply_accrual(end_date)
+
+    def restore(self, states: dict) -> None:
+        """
+        Replace opening balances with checkpointed state
+
+        :param states: dict {account_id: AccountState}
+        :return:
+        """
+        for account_id, state in states.items():
+            account = self.get_account(account_id)
+            account.balance = state.balance
+            account.accrued = state.accrued
+            if isinstance(account, CreditCardAccount):
+                account.stmt_balance = state.stmt_balance
+            account.invalidate()
+
+    def add_transactions_df(self, source: str, df: pd.DataFrame) -> None:
+        """
+        Attach a block of transactions to each account it references
+
+        :param source: str
+        :param df: pd.DataFrame with LEDGER_COLUMNS
+        :return:
+        """
+        for account_id, account_df in df.groupby('account_id', sort=False, observed=True):
+            self.get_account(account_id).set_transactions_df(source, account_df)
+
     def apply_scheduled_transactions(self, st: ScheduledTransactions):
         # apply plain transactions
         self.add_transactions(st.plain)
@@ -0,0 +1,158 @@
+from typing import Union
+
+import attr
+import dateutil.parser as dp
+import numpy as np
+import pandas as pd
+
+ACCRUAL_TRANSACTION_ID = 'accrual'
+
+compounding_periods = ['daily', 'monthly']
+
+
+@attr.define(kw_only=True)
+class Accrual:
+    """
+    Interest or growth on an account balance.
+
+    rate is an annual rate: the APY / expected annual return when compounding daily, the nominal annual rate
+    (credited rate / 12 each month end) when compounding monthly.
+    """
+    rate: float = attr.ib()
+    compounding: str = attr.ib(default='daily')
+    name: str = attr.ib(default='Interest')
+
+    @compounding.validator
+    def _check_compounding(self, attribute, value):
+        if value not in compounding_periods:
+            raise ValueError(f'Compounding must be one of {compounding_periods}. Received: {value}')
+
+    @classmethod
+    def from_spec(cls, spec: Union[dict, None]):
+        if spec is None:
+            return None
+        return Accrual(rate=float(spec['rate']), compounding=spec.get('compounding', 'daily'),
+                       name=spec.get('name', 'Interest'))
+
+    def get_factors(self, days: pd.DatetimeIndex) -> np.ndarray:
+        """
+        Growth factor applied to the balance at the end of each day
+
+        :param days: pd.DatetimeIndex
+        :return: np.ndarray
+        """
+        if self.compounding == 'daily':
+            return np.full(len(days), (1 + self.rate) ** (1 / 365))
+        return np.where(days.is_month_end, 1 + self.rate / 12, 1.0)
+
+    @classmethod
+    def accrue(cls, opening: float, flows: np.ndarray, factors: np.ndarray) -> np.ndarray:
+        """
+        End-of-day balances when flows land during the day and the balance then grows by that day's factor
+
+        B[t] = (B[t-1] + flows[t]) * factors[t] unrolls to G[t] * (opening + cumsum(flows / G[t-1])) with G the
+        cumulative product of factors, so the whole series is a handful of array operations.
+
+        :param opening: float
+        :param flows: np.ndarray Net flow per day
+        :param factors: np.ndarray
+        :return: np.ndarray
+        """
+        growth = np.cumprod(factors)
+        previous = np.concatenate([[1.0], growth[:-1]])
+        return growth * (opening + np.cumsum(flows / previous))
+
+    @classmethod
+    def get_accrued(cls, opening: float, flows: np.ndarray, factors: np.ndarray, carried: float = 0.0) -> np.ndarray:
+        """
+        Interest earned each day
+
+        :param opening: float Ledger balance at the start of the first day
+        :param flows: np.ndarray Net flow per day
+        :param factors: np.ndarray
+        :param carried: float Interest earned before the first day but not posted yet. It grows with the balance and
+                        is counted on the first day.
+        :return: np.ndarray
+        """
+        balances = cls.accrue(opening + carried, flows, factors)
+        accrued = balances - np.concatenate([[opening + carried], balances[:-1]]) - flows
+        accrued[:1] += carried
+        return accrued
+
+    @classmethod
+    def get_posting_days(cls, days: pd.DatetimeIndex) -> np.ndarray:
+        """
+        :param days: pd.DatetimeIndex
+        :return: np.ndarray True on each month's last day in the window
+        """
+        months = days.to_period('M').asi8
+        return np.append(months[1:] != months[:-1], True)
+
+    @classmethod
+    def post(cls, accrued: np.ndarray, days: pd.DatetimeIndex) -> np.ndarray:
+        """
+        Interest posted to the ledger each day: each month's total on its last day in the window, zero otherwise
+
+        :param accrued: np.ndarray See get_accrued()
+        :param days: pd.DatetimeIndex
+        :return: np.ndarray
+        """
+        last = cls.get_posting_days(days)
+        posted = np.zeros(len(days))
+        posted[last] = np.add.reduceat(accrued, np.flatnonzero(np.insert(last[:-1], 0, True)))
+        return posted
+
+    @classmethod
+    def get_flows(cls, ledger: pd.DataFrame, days: pd.DatetimeIndex) -> np.ndarray:
+        """
+        :param ledger: pd.DataFrame Ledger without accrual rows
+        :param days: pd.DatetimeIndex
+        :return: np.ndarray Net flow per day
+        """
+        # an empty ledger's date column may be object dtype, which has no .dt
+        offsets = (pd.DatetimeIndex(ledger['date']) - days[0]).days.to_numpy()
+        mask = (offsets >= 0) & (offsets < len(days))
+        return np.bincount(offsets[mask], weights=ledger['amount'].to_numpy(dtype=float)[mask], minlength=len(days))
+
+    def compute(self, account_id: str, opening: float, ledger: pd.DataFrame, start_date: str,
+                end_date: str, carried: float = 0.0) -> pd.DataFrame:
+        """
+        Summary accrual rows, one per month (the last one on end_date)
+
+        :param account_id: str
+        :param opening: float Balance at the start of start_date
+        :param ledger: pd.DataFrame Ledger without accrual rows
+        :param start_date: str
+        :param end_date: str
+        :param carried: float See get_accrued()
+        :return: pd.DataFrame with LEDGER_COLUMNS
+        """
+        days = pd.date_range(dp.parse(start_date), dp.parse(end_date), freq='D')
+        accrued = self.get_accrued(opening, self.get_flows(ledger, days), self.get_factors(days), carried)
+        posted = self.post(accrued, days)
+        last = self.get_posting_days(days)
+        df = pd.DataFrame({'date': days[last], 'amount': posted[last]})
+        df['transaction_id'] = ACCRUAL_TRANSACTION_ID
+        df['type'] = 'income'
+        df['account_id'] = account_id
+        df['name'] = self.name
+        df['counterparty_id'] = None
+        return df[['transaction_id', 'type', 'account_id', 'date', 'amount', 'name', 'counterparty_id']]
+
+    def get_pending(self, opening: float, ledger: pd.DataFrame, start_date: str, end_date: str, date: str,
+                    carried: float = 0.0) -> float:
+        """
+        Interest earned by the end of `date` that hasn't been posted to the ledger yet
+
+        :param opening: float
+        :param ledger: pd.DataFrame Ledger without accrual rows
+        :param start_date: str
+        :param end_date: str
+        :param date: str
+        :param carried: float See get_accrued()
+        :return: float
+        """
+        days = pd.date_range(dp.parse(start_date), dp.parse(end_date), freq='D')
+        accrued = self.get_accrued(opening, self.get_flows(ledger, days), self.get_factors(days), carried)
+        position = (dp.parse(date) - days[0]).days
+        return float((accrued - self.post(accrued, days))[:position + 1].sum())
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Mapping, Union
+
+import attr
+import numpy as np
+import pandas as pd
+
+from .exceptions import AccountNotFoundException, OutOfBoundsException
+from .rollup import resample_balance
+
+if TYPE_CHECKING:
+    from .snapshot import AccountSnapshot
+
+LIABILITY_ACCOUNT_TYPES = ['cc']
+
+aggregate_types = ['net_worth', 'liquid', 'debt']
+
+default_account_types = {
+    'net_worth': None,
+    'liquid':    ['checking', 'savings'],
+    'debt':      LIABILITY_ACCOUNT_TYPES
+}
+
+
+@attr.define(kw_only=True)
+class Aggregate:
+    """
+    A combined balance series over several accounts: net worth, liquid cash or debt.
+
+    Liability balances are negative in the ledger (a credit card owing $300 has a balance of -300), which is what net
+    worth and liquid want. Debt flips their sign so the amount owed is drawn as a positive line.
+    """
+    aggregate_id: str = attr.ib()
+    name: str = attr.ib()
+    type: str = attr.ib()
+    account_ids: list = attr.ib()
+    signs: list = attr.ib()
+
+    @type.validator
+    def _check_type(self, attribute, value):
+        if value not in aggregate_types:
+            raise ValueError(f'Aggregate type must be one of {aggregate_types}. Received: {value}')
+
+    @classmethod
+    def from_spec(cls, aggregate_id: str, spec: dict, accounts_spec: dict) -> Aggregate:
+        """
+        :param aggregate_id: str
+        :param spec: dict {name: str, type: net_worth|liquid|debt, account_ids: list|None}
+        :param accounts_spec: dict The spec's accounts, used for default members and sign normalisation
+        :return: Aggregate
+        """
+        agg_type = spec.get('type', 'net_worth')
+        account_ids = spec.get('account_ids')
+        if account_ids is None:
+            types = default_account_types.get(agg_type)
+            account_ids = [a for a, s in accounts_spec.items() if types is None or s['type'] in types]
+        for account_id in account_ids:
+            if account_id not in accounts_spec:
+                raise AccountNotFoundException(f'account not found: {account_id}')
+        signs = [-1.0 if agg_type == 'debt' and accounts_spec[a]['type'] in LIABILITY_ACCOUNT_TYPES else 1.0
+                 for a in account_ids]
+        return Aggregate(aggregate_id=aggregate_id, name=spec.get('name', aggregate_id), type=agg_type,
+                         account_ids=account_ids, signs=signs)
+
+    @classmethod
+    def from_specs(cls, spec: dict) -> list:
+        return [cls.from_spec(aggregate_id, aggregate_spec, spec['accounts'])
+                for aggregate_id, aggregate_spec in (spec.get('aggregates') or {}).items()]
+
+    def compute(self, accounts: Mapping[str, AccountSnapshot]) -> pd.DataFrame:
+        """
+        Align the member balances on the union of their dates, forward filling each account, and sum them
+
+        :param accounts: Mapping account_id -> AccountSnapshot
+        :return: pd.DataFrame indexed by date with amt_desc (per account breakdown), amount and balance, the same
+                 shape as Account.get_running_balance_grouped()
+        """
+        members = [accounts[a] for a in self.account_ids]
+        if len(members) == 0:
+            return pd.DataFrame({'amt_desc': [], 'amount': [], 'balance': []},
+                                index=pd.DatetimeIndex([], name='date'))
+        axis = np.unique(np.concatenate([[min(m.start_date for m in members)]] + [m.dates for m in members]))
+        # row i holds account i's balance on every axis date: the last balance on or before it, else the opening
+        matrix = np.empty((len(members), len(axis)))
+        for i, member in enumerate(members):
+            if len(member.dates) == 0:
+                # no transactions, the opening balance holds throughout
+                matrix[i] = member.balance
+                continue
+            position = np.searchsorted(member.dates, axis, side='right') - 1
+            matrix[i] = np.where(position >= 0, member.balances[np.maximum(position, 0)], member.balance)
+        matrix *= np.array(self.signs)[:, None]
+        balance = matrix.sum(axis=0)
+        openings = np.array([m.balance for m in members]) * np.array(self.signs)
+        amount = np.diff(balance, prepend=openings.sum())
+        breakdown = [pd.Series(matrix[i]).map(lambda x, name=m.name: f'{name}: ${x:.2f}')
+                     for i, m in enumerate(members)]
+        amt_desc = breakdown[0].str.cat(breakdown[1:], sep='<br>') if len(breakdown) > 1 else breakdown[0]
+        return pd.DataFrame({'amt_desc': amt_desc.to_numpy(), 'amount': amount, 'balance': balance},
+                            index=pd.DatetimeIndex(axis, name='date'))
+
+
+@attr.define(frozen=True, kw_only=True)
+class AggregateSnapshot:
+    aggregate_id: str = attr.ib()
+    name: str = attr.ib()
+    running_balance_grouped: pd.DataFrame = attr.ib()
+    ohlc: dict = attr.ib(factory=dict)
+
+    @classmethod
+    def from_aggregate(cls, aggregate: Aggregate, accounts: Mapping[str, AccountSnapshot]) -> AggregateSnapshot:
+        return AggregateSnapshot(aggregate_id=aggregate.aggregate_id, name=aggregate.name,
+                                 running_balance_grouped=aggregate.compute(accounts))
+
+    def get_running_balance_grouped(self) -> pd.DataFrame:
+        return self.running_balance_grouped.copy(deep=False)
+
+    def get_balance_ohlc(self, period='monthly') -> pd.DataFrame:
+        if period not in self.ohlc:
+            df = self.running_balance_grouped
+            opening = df['balance'].iloc[0] - df['amount'].iloc[0] if len(df.index) else 0.0
+            self.ohlc[period] = resample_balance(df.index, df['amount'], df['balance'], opening, period)
+        return self.ohlc[period].copy(deep=False)
+
+    def get_balance(self, date) -> float:
+        df = self.running_balance_grouped
+        target_date = np.datetime64(pd.Timestamp(date), 'ns')
+        position = np.searchsorted(df.index.to_numpy(), target_date, side='right')
+        if position == 0:
+            raise OutOfBoundsException(f'date {target_date} before the first date of aggregate: {self.aggregate_id}')
+        return float(df['balance'].iloc[position - 1])
+
+
+def compute_aggregates(aggregates: Union[list, None], accounts: Mapping[str, AccountSnapshot]) -> dict:
+    return {a.aggregate_id: AggregateSnapshot.from_aggregate(a, accounts) for a in aggregates or []}
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import attr
+import dateutil.parser as dp
+import pandas as pd
+
+attribution_categories = ['transaction_id', 'type']
+
+
+@attr.define(kw_only=True)
+class Attribution:
+    """
+    What moved an account's balance between two dates, by scheduled item.
+
+    opening is the balance at the start of start_date and closing the balance at the end of end_date, so
+    opening + items['amount'].sum() == closing.
+    """
+    account_id: str = attr.ib()
+    start_date: str = attr.ib()
+    end_date: str = attr.ib()
+    opening: float = attr.ib()
+    closing: float = attr.ib()
+    items: pd.DataFrame = attr.ib()
+
+    @classmethod
+    def from_ledger(cls, account_id: str, ledger: pd.DataFrame, balance: float, start_date: str,
+                    end_date: str) -> Attribution:
+        """
+        :param account_id: str
+        :param ledger: pd.DataFrame The account's ledger, see Account.get_ledger_df()
+        :param balance: float The account's opening balance, before anything in the ledger
+        :param start_date: str
+        :param end_date: str
+        :return: Attribution
+        """
+        start, end = dp.parse(start_date), dp.parse(end_date)
+        if end < start:
+            raise ValueError(f'end_date must not be before start_date. Received: {start_date} - {end_date}')
+        before = ledger['date'] < start
+        in_range = ~before & (ledger['date'] <= end)
+        opening = balance + float(ledger.loc[before, 'amount'].sum())
+        items = (ledger[in_range]
+                 .groupby(attribution_categories, observed=True, sort=False)
+                 .agg(name=('name', 'first'), count=('amount', 'size'), amount=('amount', 'sum'))
+                 .reset_index()
+                 .sort_values('amount', ascending=False, kind='stable', ignore_index=True))
+        items['transaction_id'] = items['transaction_id'].astype(str)
+        items['type'] = items['type'].astype(str)
+        return Attribution(account_id=account_id, start_date=start_date, end_date=end_date, opening=opening,
+                           closing=opening + float(items['amount'].sum()), items=items)
+
+    def get_waterfall_df(self) -> pd.DataFrame:
+        """
+        Opening balance, one step per item and the closing balance, with plotly waterfall measures
+
+        :return: pd.DataFrame with label, type, amount and measure columns
+        """
+        opening = pd.DataFrame({'label': ['Opening'], 'type': [''], 'amount': [self.opening],
+                                'measure': ['absolute']})
+        labels = self.items['name'].astype(str)
+        # categories on the x axis must be unique
+        duplicated = labels.duplicated(keep=False)
+        labels[duplicated] = labels[duplicated] + ' (' + self.items.loc[duplicated, 'transaction_id'] + ')'
+        steps = pd.DataFrame({'label': labels, 'type': self.items['type'],
+                              'amount': self.items['amount'], 'measure': 'relative'})
+        closing = pd.DataFrame({'label': ['Closing'], 'type': [''], 'amount': [self.closing], 'measure': ['total']})
+        return pd.concat([opening, steps, closing], ignore_index=True)
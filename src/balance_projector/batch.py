@@ -0,0 +1,135 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Union
+
+import attr
+import pandas as pd
+import yaml
+
+from .projector import Projector
+
+SPEC_SUFFIXES = ['.yml', '.yaml']
+
+
+@attr.define(kw_only=True)
+class SpecResult:
+    spec_file: str = attr.ib()
+    ok: bool = attr.ib()
+    seconds: float = attr.ib()
+    accounts: int = attr.ib(default=0)
+    transactions: int = attr.ib(default=0)
+    error: Union[str, None] = attr.ib(default=None)
+
+
+@attr.define(kw_only=True)
+class BatchReport:
+    results: list = attr.ib()
+    seconds: float = attr.ib()
+
+    @property
+    def throughput(self) -> float:
+        """
+        Specs per second
+        """
+        return len(self.results) / self.seconds if self.seconds > 0 else 0.0
+
+    @property
+    def failures(self) -> list:
+        return [r for r in self.results if not r.ok]
+
+    def to_df(self) -> pd.DataFrame:
+        return pd.DataFrame(list(map(attr.asdict, self.results)),
+                            columns=['spec_file', 'ok', 'seconds', 'accounts', 'transactions', 'error'])
+
+
+def discover_specs(directory) -> list:
+    """
+    Find spec files under a directory
+
+    :param directory: str
+    :return: list of str, sorted
+    """
+    return sorted(str(p) for p in Path(directory).rglob('*') if p.is_file() and p.suffix in SPEC_SUFFIXES)
+
+
+def load_spec(spec_file) -> dict:
+    with open(spec_file, 'r') as stream:
+        return yaml.safe_load(stream)
+
+
+def project_spec(spec_file, start_date, end_date, output_dir) -> SpecResult:
+    """
+    Project one spec and write a running balance CSV per account. Never raises, failures are reported in the result.
+
+    :param spec_file: str
+    :param start_date: str
+    :param end_date: str
+    :param output_dir: str Directory for this spec's results
+    :return: SpecResult
+    """
+    started = time.perf_counter()
+    try:
+        projector = Projector.from_spec(load_spec(spec_file), start_date, end_date)
+        os.makedirs(output_dir, exist_ok=True)
+        transactions = 0
+        for account_id, account in projector.accounts.accounts.items():
+            df = account.get_running_balance_grouped()
+            df.to_csv(os.path.join(output_dir, f'{account_id}.csv'), index_label='date')
+            transactions += len(account.get_transactions_df().index)
+        return SpecResult(spec_file=spec_file, ok=True, seconds=time.perf_counter() - started,
+                          accounts=len(projector.accounts.accounts), transactions=transactions)
+    except Exception as e:
+        return SpecResult(spec_file=spec_file, ok=False, seconds=time.perf_counter() - started,
+                          error=f'{type(e).__name__}: {e}')
+
+
+@attr.define(kw_only=True)
+class BatchProjector:
+    """
+    Project every spec file in a directory over a process pool.
+
+    Workers are reused for many specs and keep their date cache between them, so households sharing a schedule
+    (every other Friday, the 1st of the month) don't repeat the work. The parent only hands out file names, it never
+    parses a spec.
+    """
+    directory: str = attr.ib()
+    spec_files: list = attr.ib()
+    start_date: str = attr.ib()
+    end_date: str = attr.ib()
+    output_dir: str = attr.ib()
+    workers: Union[int, None] = attr.ib(default=None)
+
+    @classmethod
+    def from_directory(cls, directory, start_date, end_date, output_dir, workers=None):
+        return BatchProjector(directory=directory, spec_files=discover_specs(directory), start_date=start_date,
+                              end_date=end_date, output_dir=output_dir, workers=workers)
+
+    def get_result_dir(self, spec_file) -> str:
+        name = os.path.splitext(os.path.relpath(spec_file, self.directory))[0]
+        return os.path.join(self.output_dir, name)
+
+    def run(self) -> BatchReport:
+        """
+        :return: BatchReport
+        """
+        started = time.perf_counter()
+        results = []
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            futures = {
+                pool.submit(project_spec, f, self.start_date, self.end_date, self.get_result_dir(f)): f
+                for f in self.spec_files
+            }
+            for future in as_completed(futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    # the worker process itself died
+                    results.append(SpecResult(spec_file=futures[future], ok=False, seconds=0.0,
+                                              error=f'{type(e).__name__}: {e}'))
+        results.sort(key=lambda r: r.spec_file)
+        report = BatchReport(results=results, seconds=time.perf_counter() - started)
+        os.makedirs(self.output_dir, exist_ok=True)
+        report.to_df().to_csv(os.path.join(self.output_dir, 'summary.csv'), index=False)
+        return report
@@ -0,0 +1,80 @@
+from typing import Union
+
+import attr
+import dateutil.parser as dp
+import numpy as np
+import pandas as pd
+
+DEFAULT_WEEKMASK = 'Mon Tue Wed Thu Fri'
+
+roll_directions = ['forward', 'backward']
+
+
+@attr.define(kw_only=True)
+class BusinessCalendar:
+    """
+    Business days for one projection window, precomputed as a bitmap.
+
+    prev_index / next_index hold, for each day in the window, the position of the nearest business day on or
+    before / on or after it, so rolling any number of dates is a single array lookup.
+    """
+    weekmask: str = attr.ib(default=DEFAULT_WEEKMASK)
+    holidays: list = attr.ib(factory=list)
+    first_day: np.datetime64 = attr.ib()
+    bitmap: np.ndarray = attr.ib()
+    prev_index: np.ndarray = attr.ib()
+    next_index: np.ndarray = attr.ib()
+
+    @classmethod
+    def from_spec(cls, spec: Union[dict, None], start_date: str, end_date: str, padding: int = 31):
+        """
+        :param spec: dict|None {weekmask: str, holidays: list of str}
+        :param start_date: str
+        :param end_date: str
+        :param padding: int Extra days either side of the window, so dates near the edges can still roll
+        :return: BusinessCalendar
+        """
+        spec = spec or {}
+        weekmask = spec.get('weekmask') or DEFAULT_WEEKMASK
+        holidays = [dp.parse(str(h)).strftime('%Y-%m-%d') for h in spec.get('holidays') or []]
+        first_day = np.datetime64(dp.parse(start_date).date(), 'D') - padding
+        last_day = np.datetime64(dp.parse(end_date).date(), 'D') + padding
+        days = np.arange(first_day, last_day + 1, dtype='datetime64[D]')
+        bitmap = np.is_busday(days, weekmask=weekmask, holidays=holidays)
+        positions = np.arange(len(days))
+        prev_index = np.maximum.accumulate(np.where(bitmap, positions, -1))
+        next_index = np.minimum.accumulate(np.where(bitmap, positions, len(days))[::-1])[::-1]
+        return BusinessCalendar(weekmask=weekmask, holidays=holidays, first_day=first_day, bitmap=bitmap,
+                                prev_index=prev_index, next_index=next_index)
+
+    def is_busday(self, dates: list) -> np.ndarray:
+        offsets = self.get_offsets(dates)
+        return self.bitmap[offsets]
+
+    def get_offsets(self, dates: list) -> np.ndarray:
+        offsets = (np.array(dates, dtype='datetime64[D]') - self.first_day).astype(np.int64)
+        if len(offsets) and (offsets.min() < 0 or offsets.max() >= len(self.bitmap)):
+            raise ValueError('dates are outside the business calendar window')
+        return offsets
+
+    def roll(self, dates: list, direction: str) -> list:
+        """
+        Move dates that are not business days to the next (forward) or previous (backward) business day
+
+        :param dates: list of datetime
+        :param direction: str forward|backward
+        :return: list of datetime
+        """
+        if direction not in roll_directions:
+            raise ValueError(f'Roll must be one of {roll_directions}. Received: {direction}')
+        if len(dates) == 0:
+            return []
+        lookup = self.next_index if direction == 'forward' else self.prev_index
+        positions = lookup[self.get_offsets(dates)]
+        if positions.min() < 0 or positions.max() >= len(self.bitmap):
+            # no business day inside the padded window, fall back to numpy's own calendar arithmetic
+            rolled = np.busday_offset(np.array(dates, dtype='datetime64[D]'), 0, roll=direction,
+                                      weekmask=self.weekmask, holidays=self.holidays)
+        else:
+            rolled = self.first_day + positions
+        return list(pd.to_datetime(rolled).to_pydatetime())
@@ -0,0 +1,48 @@
+import threading
+from collections import OrderedDict
+
+import attr
+
+
+@attr.define(kw_only=True)
+class LRUCache:
+    """
+    Thread-safe least recently used cache
+    """
+    maxsize: int = attr.ib(default=1024)
+    items: OrderedDict = attr.ib(factory=OrderedDict)
+    lock: threading.Lock = attr.ib(factory=threading.Lock)
+    hits: int = attr.ib(default=0)
+    misses: int = attr.ib(default=0)
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.items:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self.items.move_to_end(key)
+            return self.items[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+
+    def update(self, items: dict):
+        for key, value in items.items():
+            self.put(key, value)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.items
+
+    def __len__(self):
+        with self.lock:
+            return len(self.items)
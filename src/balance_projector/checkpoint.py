@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+from typing import Union, TYPE_CHECKING
+
+import attr
+import dateutil.parser as dp
+import yaml
+from dateutil.relativedelta import relativedelta as drel
+
+from .account import CreditCardAccount
+from .datespec import DATE_FORMAT
+from .transaction import ScheduleCursor, ScheduledTransactions
+
+if TYPE_CHECKING:
+    from .projector import Projector
+
+
+@attr.define(kw_only=True)
+class AccountState:
+    balance: float = attr.ib()
+    stmt_balance: Union[float, None] = attr.ib(default=None)
+    # interest earned by the checkpoint date that only posts at the end of the month
+    accrued: float = attr.ib(default=0.0)
+
+
+@attr.define(kw_only=True)
+class Checkpoint:
+    """
+    Account balances and schedule cursors as of the end of `date`.
+
+    A projection resumed from a checkpoint starts the day after `date` and only generates occurrences from there.
+    """
+    date: str = attr.ib()
+    accounts: dict = attr.ib(factory=dict)
+    cursors: dict = attr.ib(factory=dict)
+
+    @classmethod
+    def from_projector(cls, projector: Projector, date: str) -> Checkpoint:
+        """
+        Capture state from a projection
+
+        :param projector: Projector
+        :param date: str Must be inside the projection window.
+        :return: Checkpoint
+        """
+        if not dp.parse(projector.start_date) <= dp.parse(date) <= dp.parse(projector.end_date):
+            raise ValueError(f'date must be between {projector.start_date} and {projector.end_date}. Received: {date}')
+        accounts = {}
+        for account_id, account in projector.accounts.accounts.items():
+            state = AccountState(balance=float(account.get_balance(date)),
+                                 accrued=account.get_accrued(date, projector.end_date))
+            if isinstance(account, CreditCardAccount):
+                state.stmt_balance = float(cls.get_stmt_balance(account, date))
+            accounts[account_id] = state
+        cursors = ScheduledTransactions.advance_cursors(projector.spec, projector.start_date, date,
+                                                        cursors=projector.start_cursors)
+        return Checkpoint(date=date, accounts=accounts, cursors=cursors)
+
+    @classmethod
+    def get_stmt_balance(cls, account: CreditCardAccount, date: str) -> float:
+        """
+        Balance on the most recent statement closing date on or before `date`
+
+        :param account: CreditCardAccount
+        :param date: str
+        :return: float
+        """
+        target_date = dp.parse(date)
+        close_date = target_date + drel(day=account.stmt_close_dom)
+        if close_date > target_date:
+            close_date = target_date + drel(months=-1, day=account.stmt_close_dom)
+        if close_date < dp.parse(account.start_date):
+            return account.stmt_balance
+        return account.get_balance(close_date.strftime(DATE_FORMAT))
+
+    def to_dict(self) -> dict:
+        return {
+            'date':     self.date,
+            'accounts': {k: attr.asdict(v) for k, v in self.accounts.items()},
+            'cursors':  {
+                account_id: {
+                    trans_id: {
+                        'index':     c.index,
+                        'last_date': None if c.last_date is None else c.last_date.strftime(DATE_FORMAT)
+                    } for trans_id, c in cursors.items()
+                } for account_id, cursors in self.cursors.items()
+            }
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> Checkpoint:
+        return Checkpoint(
+            date=data['date'],
+            accounts={k: AccountState(**v) for k, v in data['accounts'].items()},
+            cursors={
+                account_id: {
+                    trans_id: ScheduleCursor(index=c['index'],
+                                             last_date=None if c['last_date'] is None else dp.parse(c['last_date']))
+                    for trans_id, c in cursors.items()
+                } for account_id, cursors in data['cursors'].items()
+            }
+        )
+
+    def save(self, path):
+        with open(path, 'w') as stream:
+            yaml.safe_dump(self.to_dict(), stream, sort_keys=False)
+
+    @classmethod
+    def load(cls, path) -> Checkpoint:
+        with open(path, 'r') as stream:
+            return cls.from_dict(yaml.safe_load(stream))
@@ -1,81 +1,305 @@
+import hashlib
+import json
 from datetime import datetime, timedelta
+import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from dash import Dash, dcc, html, dash_table
+from dash import Dash, Input, Output, MATCH, dcc, html, dash_table
+
+from .cache import LRUCache
 
 DATE_FORMAT = '%Y-%m-%d'
 
+# serialised figure JSON keyed by chart fingerprint, shared by every app in the process
+figure_cache = LRUCache(maxsize=256)
 
-def create_app(*charts):
-    children = []
-    for chart in charts:
-        if chart.type == 'line':
-            fig = go.Figure()
-            fig.update_layout(title=chart.name)
-            for account in chart.accounts:
-                transactions_df = account['df']
-                fig.add_trace(
-                    go.Scatter(
-                        name=account['name'],
-                        x=transactions_df.index, y=transactions_df['balance'].round(0),
-                        mode='lines+markers',
-                        line_shape='spline',
-                        hovertext=transactions_df['amt_desc'],
-                        hovertemplate=
-                        '<b>$%{y:.2f}</b> (%{x})<br><br>' +
-                        '%{hovertext}'
-                    )
-                )
-            children.append(dcc.Graph(figure=fig))
-
-        if chart.type == 'datatable':
-            for account in chart.accounts:
-                transactions_df = account['df']
-                fig = dash_table.DataTable(
-                    columns=[
-                        dict(name='Date', id='Date', type='datetime'),
-                        # Unfortunately there is no formatting on datetime types.
-                        # https://community.plotly.com/t/is-it-any-way-to-set-format-of-date-time-in-datatable/29514
-                        # https://dash.plotly.com/datatable/typing
-                        dict(name='Description', id='Description'),
-                        dict(name='Amount', id='Amount', type='numeric', format=dash_table.FormatTemplate.money(2)),
-                        dict(name='Balance', id='Balance', type='numeric', format=dash_table.FormatTemplate.money(2))
-                    ],
-                    data=[
-                        {
-                            'Date':        row[0],
-                            'Description': row[1].replace('<br>', '\n'),
-                            # <br> works in tooltips, not datatable.
-                            # Using \n combined with style_cell={'whiteSpace': 'pre-line'} accomplishes the goal.
-                            # https://community.plotly.com/t/creating-new-line-within-datatable-cell/44145/3
-                            'Amount':      row[2],
-                            'Balance':     row[3]
-                        }
-                        for row in zip(transactions_df.index, transactions_df.amt_desc, transactions_df.amount,
-                                       transactions_df.balance)
-                    ],
-                    editable=False,
-                    filter_action='native',
-                    sort_action='native',
-                    sort_mode='single',
-                    page_action='native',
-                    page_current=0,
-                    page_size=25,
-                    style_cell={'minWidth': 95, 'maxWidth': 95, 'width': 95, 'whiteSpace': 'pre-line'},
-                    style_cell_conditional=[
-                        {
-                            'if':        {'column_id': c},
-                            'textAlign': 'left'
-                        } for c in ['Date', 'Description']
-                    ],
-                    style_data={'whitespace': 'normal', 'height': 'auto'}
+
+def create_search(app, search, accounts):
+    """
+    Search box over every account's transactions
+
+    :param app: Dash
+    :param search: callable See Projector.search()
+    :param accounts: dict account_id -> name
+    :return: html.Div
+    """
+    @app.callback(
+        Output('search-results', 'data'),
+        Input('search-text', 'value'),
+        Input('search-account', 'value'),
+        Input('search-dates', 'start_date'),
+        Input('search-dates', 'end_date')
+    )
+    def update_results(text, account_id, start_date, end_date):
+        if not text and not account_id:
+            return []
+        df = search(text=text or None, account_id=account_id or None, start_date=start_date, end_date=end_date)
+        return [
+            {
+                'Date':         row[0].strftime(DATE_FORMAT),
+                'Account':      accounts.get(row[1], row[1]),
+                'Description':  row[2],
+                'Counterparty': accounts.get(row[3], '') if isinstance(row[3], str) else '',
+                'Amount':       row[4]
+            }
+            for row in zip(df.date, df.account_id, df.name, df.counterparty_id, df.amount)
+        ]
+
+    return html.Div([
+        html.H1('Search'),
+        dcc.Input(id='search-text', type='search', placeholder='Transaction name', debounce=True),
+        dcc.Dropdown(id='search-account', placeholder='Any account',
+                     options=[{'label': name, 'value': account_id} for account_id, name in accounts.items()]),
+        dcc.DatePickerRange(id='search-dates', display_format='YYYY-MM-DD'),
+        dash_table.DataTable(
+            id='search-results',
+            columns=[
+                dict(name='Date', id='Date', type='datetime'),
+                dict(name='Account', id='Account'),
+                dict(name='Description', id='Description'),
+                dict(name='Counterparty', id='Counterparty'),
+                dict(name='Amount', id='Amount', type='numeric', format=dash_table.FormatTemplate.money(2))
+            ],
+            data=[],
+            editable=False,
+            sort_action='native',
+            page_action='native',
+            page_size=25
+        )
+    ])
+
+
+def get_chart_fingerprint(chart, webgl_threshold=None) -> str:
+    """
+    Hash of everything a chart's figure is built from: its name, type and options and every account's series
+
+    :param chart: Chart
+    :param webgl_threshold: int|None
+    :return: str
+    """
+    digest = hashlib.sha256(json.dumps([chart.name, chart.type, chart.options, webgl_threshold],
+                                       sort_keys=True, default=str).encode())
+    for account in chart.accounts:
+        digest.update(json.dumps([account['name'], bool(account.get('aggregate'))]).encode())
+        df = account['df']
+        digest.update(json.dumps([list(map(str, df.columns)), str(df.index.dtype)]).encode())
+        digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def add_ohlc_traces(fig, account, scatter):
+    """
+    Close line with a band between each period's min and max balance
+
+    :param fig: go.Figure
+    :param account: dict {name: str, df: pd.DataFrame see Account.get_balance_ohlc()}
+    :param scatter: go.Scatter|go.Scattergl
+    :return:
+    """
+    ohlc_df = account['df']
+    x = ohlc_df.index.to_timestamp()
+    for column, fill in [('max', None), ('min', 'tonexty')]:
+        fig.add_trace(
+            scatter(
+                name=f"{account['name']} {column}", legendgroup=account['name'], showlegend=False,
+                x=x, y=ohlc_df[column].round(0), mode='lines', line=dict(width=0), fill=fill,
+                hoverinfo='skip'
+            )
+        )
+    fig.add_trace(
+        scatter(
+            name=account['name'], legendgroup=account['name'],
+            x=x, y=ohlc_df['close'].round(0),
+            mode='lines+markers',
+            line=dict(dash='dash' if account.get('aggregate') else 'solid'),
+            customdata=ohlc_df[['open', 'min', 'max', 'net']].round(2).to_numpy(),
+            hovertemplate=
+            '<b>$%{y:.2f}</b> (%{x})<br><br>' +
+            'Open: $%{customdata[0]:.2f}<br>Min: $%{customdata[1]:.2f}<br>Max: $%{customdata[2]:.2f}<br>' +
+            'Net: $%{customdata[3]:.2f}'
+        )
+    )
+
+
+def create_line_figure(chart, webgl_threshold=None):
+    fig = go.Figure()
+    fig.update_layout(title=chart.name)
+    for account in chart.accounts:
+        if chart.options.get('resample'):
+            webgl = webgl_threshold is not None and len(account['df'].index) > webgl_threshold
+            add_ohlc_traces(fig, account, go.Scattergl if webgl else go.Scatter)
+            continue
+        transactions_df = account['df']
+        # WebGL draws large series much faster, but has no spline lines
+        webgl = webgl_threshold is not None and len(transactions_df.index) > webgl_threshold
+        scatter = go.Scattergl if webgl else go.Scatter
+        fig.add_trace(
+            scatter(
+                name=account['name'],
+                x=transactions_df.index, y=transactions_df['balance'].round(0),
+                mode='lines' if account.get('aggregate') or webgl else 'lines+markers',
+                line=dict(shape='linear' if webgl else 'spline',
+                          dash='dash' if account.get('aggregate') else 'solid'),
+                hovertext=transactions_df['amt_desc'],
+                hovertemplate=
+                '<b>$%{y:.2f}</b> (%{x})<br><br>' +
+                '%{hovertext}'
+            )
+        )
+    return fig
+
+
+def create_rollup_figure(chart):
+    fig = go.Figure()
+    fig.update_layout(title=chart.name, barmode='relative')
+    for account in chart.accounts:
+        rollup_df = account['df']
+        for category in rollup_df.columns:
+            fig.add_trace(
+                go.Bar(
+                    name=f"{account['name']}: {category}",
+                    x=rollup_df.index.astype(str), y=rollup_df[category].round(2),
+                    hovertemplate='<b>$%{y:.2f}</b> (%{x})'
                 )
-                children.append(html.Div([
-                    html.H1(account['name']),
-                    fig
-                ]))
+            )
+    return fig
 
+
+def create_waterfall_figure(chart):
+    fig = go.Figure()
+    fig.update_layout(title=f"{chart.name} ({chart.options['start_date']} - {chart.options['end_date']})",
+                      waterfallgroupgap=0.3)
+    for account in chart.accounts:
+        waterfall_df = account['df']
+        fig.add_trace(
+            go.Waterfall(
+                name=account['name'],
+                x=waterfall_df['label'] if len(chart.accounts) == 1 else
+                [[account['name']] * len(waterfall_df.index), waterfall_df['label']],
+                y=waterfall_df['amount'].round(2),
+                measure=waterfall_df['measure'],
+                hovertext=waterfall_df['type'],
+                hovertemplate='<b>$%{y:.2f}</b> %{x}<br>%{hovertext}'
+            )
+        )
+    return fig
+
+
+figure_types = ['line', 'rollup', 'waterfall']
+
+
+def get_figure_json(chart, webgl_threshold=None) -> str:
+    """
+    Serialised figure for a chart, built on the first request for its fingerprint
+
+    :param chart: Chart
+    :param webgl_threshold: int|None
+    :return: str
+    """
+    key = get_chart_fingerprint(chart, webgl_threshold)
+    figure_json = figure_cache.get(key)
+    if figure_json is None:
+        if chart.type == 'line':
+            fig = create_line_figure(chart, webgl_threshold)
+        elif chart.type == 'rollup':
+            fig = create_rollup_figure(chart)
+        else:
+            fig = create_waterfall_figure(chart)
+        figure_json = fig.to_json()
+        figure_cache.put(key, figure_json)
+    return figure_json
+
+
+def create_datatables(chart):
+    children = []
+    for account in chart.accounts:
+        transactions_df = account['df']
+        fig = dash_table.DataTable(
+            columns=[
+                dict(name='Date', id='Date', type='datetime'),
+                # Unfortunately there is no formatting on datetime types.
+                # https://community.plotly.com/t/is-it-any-way-to-set-format-of-date-time-in-datatable/29514
+                # https://dash.plotly.com/datatable/typing
+                dict(name='Description', id='Description'),
+                dict(name='Amount', id='Amount', type='numeric', format=dash_table.FormatTemplate.money(2)),
+                dict(name='Balance', id='Balance', type='numeric', format=dash_table.FormatTemplate.money(2))
+            ],
+            data=[
+                {
+                    'Date':        row[0],
+                    'Description': row[1].replace('<br>', '\n'),
+                    # <br> works in tooltips, not datatable.
+                    # Using \n combined with style_cell={'whiteSpace': 'pre-line'} accomplishes the goal.
+                    # https://community.plotly.com/t/creating-new-line-within-datatable-cell/44145/3
+                    'Amount':      row[2],
+                    'Balance':     row[3]
+                }
+                for row in zip(transactions_df.index, transactions_df.amt_desc, transactions_df.amount,
+                               transactions_df.balance)
+            ],
+            editable=False,
+            filter_action='native',
+            sort_action='native',
+            sort_mode='single',
+            page_action='native',
+            page_current=0,
+            page_size=25,
+            style_cell={'minWidth': 95, 'maxWidth': 95, 'width': 95, 'whiteSpace': 'pre-line'},
+            style_cell_conditional=[
+                {
+                    'if':        {'column_id': c},
+                    'textAlign': 'left'
+                } for c in ['Date', 'Description']
+            ],
+            style_data={'whitespace': 'normal', 'height': 'auto'}
+        )
+        children.append(html.Div([
+            html.H1(account['name']),
+            fig
+        ]))
+    return children
+
+
+def create_chart(chart, webgl_threshold=None) -> list:
+    """
+    Components for one chart
+
+    :param chart: Chart
+    :param webgl_threshold: int|None
+    :return: list
+    """
+    if chart.type in figure_types:
+        return [dcc.Graph(figure=json.loads(get_figure_json(chart, webgl_threshold)))]
+    if chart.type == 'datatable':
+        return create_datatables(chart)
+    return []
+
+
+def create_app(*charts, search=None, accounts=None, webgl_threshold=None):
+    """
+    Charts are placeholders filled in by one callback each after the page loads, so the first chart shows while
+    the others are still being built.
+
+    :param charts: Chart
+    :param search: callable|None Adds a search box when given, see Projector.search()
+    :param accounts: dict|None account_id -> name, for the search box
+    :param webgl_threshold: int|None Draw line traces with more points than this with WebGL (Scattergl)
+    :return: Dash
+    """
     app = Dash(__name__)
+    children = []
+    if search is not None:
+        children.append(create_search(app, search, accounts or {}))
+    for index, chart in enumerate(charts):
+        children.append(dcc.Loading(html.Div(id={'type': 'chart', 'index': index})))
+
+    @app.callback(
+        Output({'type': 'chart', 'index': MATCH}, 'children'),
+        Input({'type': 'chart', 'index': MATCH}, 'id')
+    )
+    def render_chart(chart_id):
+        return create_chart(charts[chart_id['index']], webgl_threshold)
+
     app.layout = html.Div(
         children=[
             html.H1(children="Balance Projector", ),
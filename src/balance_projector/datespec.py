@@ -3,12 +3,20 @@ import attr
 import dateutil.parser as dp
 import dateutil.rrule as dr
 
+from .busday import BusinessCalendar
+from .cache import LRUCache
+
 DATE_FORMAT = '%Y-%m-%d'
 
+# Generated dates keyed by DateSpec.cache_key. Schedules like "every other Friday" repeat across specs, and each
+# batch worker keeps its cache across every spec it projects.
+date_cache = LRUCache(maxsize=4096)
+
 frequency_map = {
     'daily':   dr.DAILY,
     'weekly':  dr.WEEKLY,
-    'monthly': dr.MONTHLY
+    'monthly': dr.MONTHLY,
+    'yearly':  dr.YEARLY
 }
 
 weekday_map = {
@@ -30,24 +38,76 @@ class DateSpec:
     interval: int = attr.ib()
     day_of_week: Union[str, None] = attr.ib()
     day_of_month: Union[int, None] = attr.ib()
+    week_of_month: Union[int, None] = attr.ib(default=None)
+    month: Union[int, None] = attr.ib(default=None)
+    roll: Union[str, None] = attr.ib(default=None)
 
     @classmethod
     def from_spec(cls, spec):
         return DateSpec(start_date=spec['start_date'], end_date=spec['end_date'],
                         frequency=spec['frequency'], interval=spec['interval'],
-                        day_of_week=spec['day_of_week'], day_of_month=spec['day_of_month'])
+                        day_of_week=spec['day_of_week'], day_of_month=spec['day_of_month'],
+                        week_of_month=spec.get('week_of_month'), month=spec.get('month'), roll=spec.get('roll'))
+
+    def cache_key(self, start_date, end_date, after=None) -> tuple:
+        return (self.start_date, self.end_date, self.frequency, self.interval, self.day_of_week, self.day_of_month,
+                self.week_of_month, self.month, start_date, end_date, after)
 
-    def generate_dates(self, start_date, end_date):
+    def generate_dates(self, start_date, end_date, after=None, calendar: BusinessCalendar = None):
         """
-        Generate dates according to spec. Filtered by start_date, end_date
+        Generate dates according to spec, rolled to business days if the spec asks for it. Filtered by
+        start_date, end_date
 
         :param start_date:
         :param end_date:
+        :param after: datetime|None Last scheduled date already generated, see generate_scheduled_dates()
+        :param calendar: BusinessCalendar|None Precomputed calendar for the projection window
         :return:
         """
+        return self.adjust(self.generate_scheduled_dates(start_date, end_date, after), calendar)
+
+    def adjust(self, dates: list, calendar: BusinessCalendar = None) -> list:
+        """
+        Roll scheduled dates that fall on non-business days
+
+        :param dates: list
+        :param calendar: BusinessCalendar|None Defaults to Monday-Friday without holidays
+        :return: list
+        """
+        if self.roll is None or len(dates) == 0:
+            return dates
+        if calendar is None:
+            calendar = BusinessCalendar.from_spec(None, dates[0].strftime(DATE_FORMAT),
+                                                  dates[-1].strftime(DATE_FORMAT))
+        return calendar.roll(dates, self.roll)
+
+    def generate_scheduled_dates(self, start_date, end_date, after=None):
+        """
+        Generate dates according to the rrule, before any business day adjustment. Filtered by start_date, end_date
+
+        Occurrences are selected by their scheduled date, so a cursor's last_date is always one of these.
+
+        :param start_date:
+        :param end_date:
+        :param after: datetime|None Last date already generated. The rrule resumes from here instead of
+                      iterating again from the start of the spec.
+        :return:
+        """
+        key = self.cache_key(start_date, end_date, after)
+        dates = date_cache.get(key)
+        if dates is None:
+            dates = tuple(self.expand_rrule(start_date, end_date, after))
+            date_cache.put(key, dates)
+        return list(dates)
+
+    def expand_rrule(self, start_date, end_date, after=None):
+        """
+        Uncached date generation, see generate_dates()
+        """
         start_date = dp.parse(start_date)
         end_date = dp.parse(end_date)
-        rrule_start = dp.parse(self.start_date)
+        # Resuming from a previous occurrence keeps the interval aligned with the original dtstart.
+        rrule_start = dp.parse(self.start_date) if after is None else after
         # Dates from spec could (more likely as time progresses) generate dates we don't care about.
         # Here we set the max `until` argument for the rrule.
         if self.end_date is None:
@@ -60,36 +120,40 @@ class DateSpec:
             rrule_end = end_date if spec_end_date > end_date else spec_end_date
 
         """
-        Specify "last day of month" when self.day_of_month would exclude certain months.
+        Fall back to "last day of month" when self.day_of_month would exclude certain months.
 
         See this StackOverflow answer for discussion of the issue.
         https://stackoverflow.com/questions/38328313/dateutils-rrule-returns-dates-that-2-months-apart/38555283#38555283
         """
         day_of_month = self.day_of_month
+        bysetpos = None
         if day_of_month in [29, 30, 31]:
             """
-            Specify "last day of the month" by passing bymonthday=-1 to the rrule generator, thereby including 
-            months like February where self.day_of_month would be "out of bounds".
-
-            TODO Fix edge cases 
-
-            This solution still leaves edge cases where, for example:
-
-            day_of_month = 29
-            October has 31 days
-            Date generated as 2021-10-31
-            More accurate would be 2021-10-29
+            Pass both the requested day and the last day (-1), then keep the first of the two with bysetpos=1.
+            Months that have the requested day get it (2021-10-29), shorter months like February get their last day.
             """
-            day_of_month = -1
+            day_of_month = (day_of_month, -1)
+            bysetpos = 1
+        byweekday = weekday_map.get(self.day_of_week)
+        if byweekday is not None and self.week_of_month is not None:
+            # nth weekday of the month, e.g. week_of_month 2 = second Tuesday, -1 = last Friday
+            byweekday = byweekday(self.week_of_month)
+        bymonth = self.month
+        if self.frequency == 'yearly' and bymonth is None:
+            bymonth = rrule_start.month
         rr = dr.rrule(
             frequency_map.get(self.frequency),
             dtstart=rrule_start,
             until=rrule_end,
             interval=self.interval,
-            byweekday=weekday_map.get(self.day_of_week),
-            bymonthday=day_of_month
+            byweekday=byweekday,
+            bymonthday=day_of_month,
+            bymonth=bymonth,
+            bysetpos=bysetpos
         )
         dates = list(rr)
         # Filter start dates. End dates were limited in rrule
         dates = [d for d in dates if d >= start_date]
+        if after is not None:
+            dates = [d for d in dates if d > after]
         return dates
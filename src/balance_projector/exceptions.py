@@ -6,5 +6,15 @@ class AccountNotFoundException(Exception):
     pass
 
 
+class AggregateNotFoundException(Exception):
+    pass
+
+
 class OutOfBoundsException(Exception):
     pass
+
+
+class QueryException(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
@@ -0,0 +1,150 @@
+from typing import Union
+
+import attr
+import dateutil.parser as dp
+import numpy as np
+
+from .linear import LinearProjection
+
+
+@attr.define(kw_only=True)
+class Variable:
+    """
+    A plain scheduled amount to search over
+    """
+    account_id: str = attr.ib()
+    transaction_id: str = attr.ib()
+    lower: float = attr.ib(default=0.0)
+    upper: float = attr.ib()
+    objective: str = attr.ib(default='max')
+
+    @objective.validator
+    def _check_objective(self, attribute, value):
+        if value not in ['max', 'min']:
+            raise ValueError(f'Objective must be one of "max", "min". Received: {value}')
+
+    @property
+    def key(self) -> tuple:
+        return self.account_id, self.transaction_id
+
+    @classmethod
+    def from_str(cls, value: str):
+        """
+        Parse "account_id.transaction_id:lower:upper[:max|min]"
+
+        :param value: str
+        :return: Variable
+        """
+        parts = value.split(':')
+        if len(parts) not in [3, 4] or '.' not in parts[0]:
+            raise ValueError(f'Expected account_id.transaction_id:lower:upper[:max|min]. Received: {value}')
+        account_id, transaction_id = parts[0].split('.', 1)
+        return Variable(account_id=account_id, transaction_id=transaction_id, lower=float(parts[1]),
+                        upper=float(parts[2]), objective=parts[3] if len(parts) == 4 else 'max')
+
+
+@attr.define(kw_only=True)
+class Constraint:
+    """
+    Keep an account's daily balance within bounds, optionally only between start_date and end_date
+    """
+    account_id: str = attr.ib()
+    min_balance: Union[float, None] = attr.ib(default=None)
+    max_balance: Union[float, None] = attr.ib(default=None)
+    start_date: Union[str, None] = attr.ib(default=None)
+    end_date: Union[str, None] = attr.ib(default=None)
+
+    def is_satisfied(self, projection: LinearProjection, balances: np.ndarray) -> bool:
+        """
+        :param projection: LinearProjection
+        :param balances: np.ndarray (account x day) array from LinearProjection.evaluate_array
+        :return: bool
+        """
+        row = balances[projection.account_ids.index(self.account_id)]
+        start = 0 if self.start_date is None else projection.days.searchsorted(dp.parse(self.start_date))
+        end = len(row) if self.end_date is None else projection.days.searchsorted(dp.parse(self.end_date),
+                                                                                side='right')
+        window = row[start:end]
+        if len(window) == 0:
+            return True
+        if self.min_balance is not None and window.min() < self.min_balance:
+            return False
+        if self.max_balance is not None and window.max() > self.max_balance:
+            return False
+        return True
+
+
+@attr.define(kw_only=True)
+class GoalSeekResult:
+    amounts: dict = attr.ib()
+    feasible: bool = attr.ib()
+    evaluations: int = attr.ib()
+
+
+@attr.define(kw_only=True)
+class GoalSeek:
+    """
+    Search scheduled amounts that satisfy balance constraints.
+
+    Each variable is bisected in turn while the others are held at their current value (spec amount, or the result
+    of an earlier variable). Feasibility is assumed to be monotonic in each variable, which holds when larger amounts
+    only ever push a constrained balance one way. The compiled LinearProjection is reused for every evaluation, so
+    dates are generated once.
+    """
+    projection: LinearProjection = attr.ib()
+    variables: list = attr.ib()
+    constraints: list = attr.ib()
+    tolerance: float = attr.ib(default=0.01)
+    evaluations: int = attr.ib(default=0)
+
+    def is_feasible(self, vector: np.ndarray) -> bool:
+        self.evaluations += 1
+        balances = self.projection.evaluate_array(vector)
+        return all(c.is_satisfied(self.projection, balances) for c in self.constraints)
+
+    def solve(self) -> GoalSeekResult:
+        """
+        :return: GoalSeekResult
+        """
+        vector = self.projection.get_amount_vector()
+        feasible = True
+        for variable in self.variables:
+            if variable.key not in self.projection.items:
+                raise KeyError(f'scheduled transaction not found or not a plain amount: {variable.key}')
+            position = self.projection.items.index(variable.key)
+            value, ok = self.bisect(vector, position, variable)
+            vector[position] = value
+            feasible = feasible and ok
+        amounts = {v.key: float(vector[self.projection.items.index(v.key)]) for v in self.variables}
+        return GoalSeekResult(amounts=amounts, feasible=feasible and self.is_feasible(vector),
+                              evaluations=self.evaluations)
+
+    def bisect(self, vector: np.ndarray, position: int, variable: Variable) -> tuple:
+        """
+        Find the largest (or smallest) feasible value of one variable
+
+        :param vector: np.ndarray Current amounts, not modified
+        :param position: int
+        :param variable: Variable
+        :return: (value, feasible)
+        """
+        trial = vector.copy()
+
+        def feasible_at(value):
+            trial[position] = value
+            return self.is_feasible(trial)
+
+        # `good` is always feasible, `bad` never
+        good, bad = (variable.lower, variable.upper) if variable.objective == 'max' else (variable.upper,
+                                                                                       variable.lower)
+        if feasible_at(bad):
+            return bad, True
+        if not feasible_at(good):
+            return good, False
+        while abs(bad - good) > self.tolerance:
+            middle = (good + bad) / 2
+            if feasible_at(middle):
+                good = middle
+            else:
+                bad = middle
+        return good, True
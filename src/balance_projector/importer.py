@@ -0,0 +1,194 @@
+from typing import Union
+
+import attr
+import dateutil.parser as dp
+import numpy as np
+import pandas as pd
+
+from .account import LEDGER_COLUMNS
+from .datespec import DATE_FORMAT
+from .transaction import JournalEntry, ScheduledTransactions
+
+# Columns used to identify a duplicate row across chunks and files
+DEDUPE_COLUMNS = ['account_id', 'date', 'amount', 'name']
+
+DEFAULT_COLUMN_MAP = {
+    'account_id': 'account_id',
+    'date':       'date',
+    'amount':     'amount',
+    'name':       'name'
+}
+
+
+def empty_actuals() -> pd.DataFrame:
+    """
+    No actuals, with the same dtypes as an imported frame so they still merge against scheduled transactions
+
+    :return: pd.DataFrame with LEDGER_COLUMNS
+    """
+    return pd.DataFrame(columns=LEDGER_COLUMNS).astype({'transaction_id': str, 'type': str, 'account_id': str,
+                                                        'date': 'datetime64[ns]', 'amount': float, 'name': str})
+
+
+@attr.define(kw_only=True)
+class TransactionImporter:
+    """
+    Stream actual transactions from bank CSV exports into ledger shaped DataFrames.
+
+    Files are read `chunksize` rows at a time. Each chunk is trimmed to the projection window and the
+    accounts in the spec before anything is kept, so memory is bounded by the window rather than the
+    size of the export. Duplicates are dropped against a hash index that persists across chunks and files.
+    """
+    account_ids: list = attr.ib()
+    start_date: str = attr.ib()
+    end_date: str = attr.ib()
+    account_id: Union[str, None] = attr.ib(default=None)
+    chunksize: int = attr.ib(default=50000)
+    column_map: dict = attr.ib(factory=lambda: dict(DEFAULT_COLUMN_MAP))
+    date_format: str = attr.ib(default=DATE_FORMAT)
+    transaction_id: str = attr.ib(default='actual')
+    index: set = attr.ib(factory=set)
+
+    @classmethod
+    def from_spec(cls, spec, start_date, end_date, **kwargs):
+        return TransactionImporter(account_ids=list(spec['accounts'].keys()), start_date=start_date,
+                                   end_date=end_date, **kwargs)
+
+    def read_csv(self, filepath_or_buffer) -> pd.DataFrame:
+        """
+        Read a CSV export in chunks
+
+        :param filepath_or_buffer: str|file-like
+        :return: pd.DataFrame with LEDGER_COLUMNS
+        """
+        column_map = dict(self.column_map)
+        if self.account_id is not None:
+            # single-account export, there is no account column to read
+            column_map.pop('account_id', None)
+        frames = []
+        reader = pd.read_csv(filepath_or_buffer, usecols=list(column_map.values()), chunksize=self.chunksize,
+                             dtype={column_map['name']: str})
+        with reader:
+            for chunk in reader:
+                chunk = self.deduplicate(self.normalize(chunk, column_map))
+                if len(chunk.index) > 0:
+                    frames.append(chunk)
+        if len(frames) == 0:
+            return empty_actuals()
+        return pd.concat(frames, ignore_index=True)
+
+    def read_csv_files(self, paths) -> pd.DataFrame:
+        """
+        Read several CSV exports, deduplicating across all of them
+
+        :param paths: list
+        :return: pd.DataFrame with LEDGER_COLUMNS
+        """
+        frames = [df for df in map(self.read_csv, paths) if len(df.index) > 0]
+        if len(frames) == 0:
+            return empty_actuals()
+        return pd.concat(frames, ignore_index=True)
+
+    def normalize(self, chunk: pd.DataFrame, column_map: dict) -> pd.DataFrame:
+        """
+        Rename, parse and filter a raw chunk down to rows inside the projection window
+
+        :param chunk: pd.DataFrame
+        :param column_map: dict
+        :return: pd.DataFrame
+        """
+        df = chunk.rename(columns={v: k for k, v in column_map.items()})
+        if self.account_id is not None:
+            df['account_id'] = self.account_id
+        df['date'] = pd.to_datetime(df['date'], format=self.date_format)
+        df['amount'] = df['amount'].astype(float).round(decimals=2)
+        df['name'] = df['name'].fillna('').str.strip()
+        mask = (df['account_id'].isin(self.account_ids)
+                & (df['date'] >= dp.parse(self.start_date))
+                & (df['date'] <= dp.parse(self.end_date)))
+        df = df[mask]
+        df['transaction_id'] = self.transaction_id
+        df['type'] = np.where(df['amount'] >= 0, 'income', 'expense')
+        df['counterparty_id'] = None
+        return df[LEDGER_COLUMNS]
+
+    def deduplicate(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Drop rows already seen in this chunk, a previous chunk or a previous file
+
+        :param df: pd.DataFrame
+        :return: pd.DataFrame
+        """
+        keys = pd.util.hash_pandas_object(df[DEDUPE_COLUMNS], index=False).to_numpy()
+        seen = np.fromiter(map(self.index.__contains__, keys.tolist()), dtype=bool, count=len(keys))
+        mask = ~(seen | pd.Series(keys).duplicated().to_numpy())
+        self.index.update(keys[mask].tolist())
+        return df[mask]
+
+
+@attr.define(kw_only=True)
+class Reconciliation:
+    """
+    Scheduled transactions with actuals merged in, and a report of which occurrences were matched.
+    """
+    scheduled: ScheduledTransactions = attr.ib()
+    matches: pd.DataFrame = attr.ib()
+
+    @classmethod
+    def from_actuals(cls, st: ScheduledTransactions, actuals: pd.DataFrame, cutoff: str, tolerance_days: int = 3):
+        """
+        Reconcile actuals against scheduled occurrences
+
+        Every projected occurrence before `cutoff` is replaced by the actuals. On or after `cutoff`, an occurrence
+        that matches an actual (same account and amount within `tolerance_days`) has already posted and is dropped.
+
+        :param st: ScheduledTransactions
+        :param actuals: pd.DataFrame with LEDGER_COLUMNS
+        :param cutoff: str
+        :param tolerance_days: int
+        :return: Reconciliation
+        """
+        cutoff_date = dp.parse(cutoff)
+        # actuals are per account, so transfers are matched leg by leg
+        legs = [(i, leg) for i, t in enumerate(st.plain)
+                for leg in (t.get_transactions() if isinstance(t, JournalEntry) else [t])]
+        scheduled = pd.DataFrame({
+            'position':       np.arange(len(legs)),
+            'transaction_id': [leg.transaction_id for _, leg in legs],
+            'account_id':     [leg.account_id for _, leg in legs],
+            'date':           pd.to_datetime([leg.date for _, leg in legs]),
+            'amount':         np.round([float(leg.amount) for _, leg in legs], decimals=2)
+        })
+        right = actuals[['account_id', 'date', 'amount', 'name']].reset_index(drop=True)
+        right['actual_row'] = np.arange(len(right.index))
+        right['actual_date'] = right['date']
+        right['date'] = right['date'].astype(scheduled['date'].dtype)
+        matches = pd.merge_asof(scheduled.sort_values('date'), right.sort_values('date'), on='date',
+                                by=['account_id', 'amount'], direction='nearest',
+                                tolerance=pd.Timedelta(days=tolerance_days))
+        matches = matches.dropna(subset=['actual_row'])
+        # an actual can only settle one occurrence, keep the nearest one
+        matches['distance'] = (matches['actual_date'] - matches['date']).abs()
+        matches = matches.sort_values('distance', kind='stable').drop_duplicates('actual_row')
+        matches = matches.sort_values('position', ignore_index=True)
+
+        drop = np.zeros(len(legs), dtype=bool)
+        drop[matches['position'].to_numpy()] = True
+        drop |= (scheduled['date'] < cutoff_date).to_numpy()
+        kept = {}
+        for (i, leg), d in zip(legs, drop):
+            if not d:
+                kept.setdefault(i, []).append(leg)
+        plain = []
+        for i, t in enumerate(st.plain):
+            if isinstance(t, JournalEntry) and len(kept.get(i, [])) == 1:
+                # only one side has posted, keep the other as a plain transaction. Its counterparty's side is an
+                # actual now, so it no longer has one
+                plain.extend(attr.evolve(leg, counterparty_id=None) for leg in kept[i])
+            elif i in kept:
+                plain.append(t)
+        dynamic = [t for t in st.dynamic if t.date >= cutoff_date]
+        scheduled = ScheduledTransactions(plain=plain, dynamic=dynamic, cursors=st.cursors)
+        return Reconciliation(scheduled=scheduled,
+                              matches=matches[['transaction_id', 'account_id', 'date', 'amount', 'actual_date',
+                                               'name']])
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+from typing import Union
+
+import attr
+import numpy as np
+import pandas as pd
+
+from .transaction import JournalEntry
+
+JOURNAL_COLUMNS = ['transaction_id', 'type', 'date', 'amount', 'name', 'from_account_id', 'to_account_id']
+
+# Stands in for the outside world in balance checks: income comes from it, expenses go to it.
+EXTERNAL_ACCOUNT_ID = 'external'
+
+
+@attr.define(kw_only=True)
+class Journal:
+    """
+    Double-entry record of transfers between accounts.
+
+    Every transfer is stored once, appended column by column. Account ledgers see their side of each entry through
+    get_account_view(), which builds that account's rows from the journal on first use and caches them. Adding an
+    entry only invalidates the cached rows of the two accounts it touches.
+    """
+    columns: dict = attr.ib(factory=lambda: {column: [] for column in JOURNAL_COLUMNS})
+    journal_df: Union[pd.DataFrame, None] = attr.ib(default=None)
+    views: dict = attr.ib(factory=dict)
+
+    def add(self, entry: JournalEntry):
+        for column, values in self.columns.items():
+            values.append(getattr(entry, column))
+        self.journal_df = None
+        self.views.pop(entry.from_account_id, None)
+        self.views.pop(entry.to_account_id, None)
+
+    def __len__(self):
+        return len(self.columns['transaction_id'])
+
+    def get_journal_df(self) -> pd.DataFrame:
+        """
+        :return: pd.DataFrame with JOURNAL_COLUMNS, one row per entry
+        """
+        if self.journal_df is None:
+            self.journal_df = pd.DataFrame(self.columns, columns=JOURNAL_COLUMNS)
+        return self.journal_df
+
+    def get_account_view(self, account_id: str) -> pd.DataFrame:
+        """
+        This account's side of every entry touching it: debits for entries from it, credits for entries to it
+
+        :param account_id: str
+        :return: pd.DataFrame with the ledger columns
+        """
+        if account_id not in self.views:
+            df = self.get_journal_df()
+            debits = (df['from_account_id'] == account_id).to_numpy()
+            credits = (df['to_account_id'] == account_id).to_numpy()
+            rows = df[debits | credits]
+            is_debit = debits[debits | credits]
+            self.views[account_id] = pd.DataFrame({
+                'transaction_id':  rows['transaction_id'].to_numpy(),
+                'type':            rows['type'].to_numpy(),
+                'account_id':      account_id,
+                'date':            rows['date'].to_numpy(),
+                'amount':          np.where(is_debit, -rows['amount'].to_numpy(dtype=float),
+                                            rows['amount'].to_numpy(dtype=float)),
+                'name':            rows['name'].to_numpy(),
+                'counterparty_id': np.where(is_debit, rows['to_account_id'].to_numpy(),
+                                            rows['from_account_id'].to_numpy())
+            })
+        return self.views[account_id]
+
+    @classmethod
+    def combine_ledger(cls, ledger: pd.DataFrame, entries: pd.DataFrame) -> pd.DataFrame:
+        """
+        Full journal: the transfer entries plus every single-sided ledger row (income, expense, imported actuals)
+        as an entry against the external pseudo-account
+
+        :param ledger: pd.DataFrame Combined ledger of every account
+        :param entries: pd.DataFrame See get_journal_df()
+        :return: pd.DataFrame with JOURNAL_COLUMNS
+        """
+        single = ledger[ledger['counterparty_id'].isna()]
+        outflow = (single['amount'] < 0).to_numpy()
+        account_ids = single['account_id'].astype(object).to_numpy()
+        external = pd.DataFrame({
+            'transaction_id':  single['transaction_id'].to_numpy(),
+            'type':            single['type'].to_numpy(),
+            'date':            single['date'].to_numpy(),
+            'amount':          single['amount'].abs().to_numpy(dtype=float),
+            'name':            single['name'].to_numpy(),
+            'from_account_id': np.where(outflow, account_ids, EXTERNAL_ACCOUNT_ID),
+            'to_account_id':   np.where(outflow, EXTERNAL_ACCOUNT_ID, account_ids)
+        })
+        frames = [df for df in [entries, external] if len(df.index) > 0]
+        if len(frames) == 0:
+            return pd.DataFrame(columns=JOURNAL_COLUMNS)
+        return pd.concat(frames, ignore_index=True).sort_values('date', kind='stable', ignore_index=True)
+
+    @classmethod
+    def check_balanced(cls, ledger: pd.DataFrame, tolerance: float = 0.005) -> pd.DataFrame:
+        """
+        Posting events whose postings don't net to zero across accounts
+
+        Single-sided rows (no counterparty) get an offsetting posting in the external pseudo-account, so every
+        event should sum to zero. A transfer leg whose other side is missing from the counterparty's ledger won't.
+
+        :param ledger: pd.DataFrame Combined ledger of every account
+        :param tolerance: float
+        :return: pd.DataFrame (date, transaction_id) -> net amount, empty when the books balance
+        """
+        external = ledger['counterparty_id'].isna().to_numpy()
+        amounts = ledger['amount'].to_numpy(dtype=float)
+        keys = ledger[['date', 'transaction_id']].astype({'transaction_id': object})
+        postings = pd.concat([keys, keys[external]], ignore_index=True)
+        postings['amount'] = np.concatenate([amounts, -amounts[external]])
+        net = postings.groupby(['date', 'transaction_id'], sort=True)['amount'].sum()
+        return net[net.abs() > tolerance].rename('net').reset_index()
@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Union, TYPE_CHECKING
+
+import attr
+import dateutil.parser as dp
+import numpy as np
+import pandas as pd
+from dateutil.relativedelta import relativedelta as drel
+
+from .accrual import Accrual
+from .busday import BusinessCalendar
+from .transaction import ScheduledTransaction, ScheduledTransactions
+
+if TYPE_CHECKING:
+    from .account import Accounts
+
+
+@attr.define(kw_only=True)
+class SparseOperator:
+    """
+    Sparse matrix in coordinate form. Only the matrix-vector product is needed, so numpy is enough.
+    """
+    rows: np.ndarray = attr.ib()
+    cols: np.ndarray = attr.ib()
+    data: np.ndarray = attr.ib()
+    shape: tuple = attr.ib()
+
+    @classmethod
+    def from_triplets(cls, rows: list, cols: list, data: list, shape: tuple):
+        return SparseOperator(rows=np.asarray(rows, dtype=np.int64), cols=np.asarray(cols, dtype=np.int64),
+                              data=np.asarray(data, dtype=float), shape=shape)
+
+    def dot(self, vector: np.ndarray) -> np.ndarray:
+        return np.bincount(self.rows, weights=self.data * vector[self.cols], minlength=self.shape[0])
+
+
+@attr.define(kw_only=True)
+class DynamicItem:
+    """
+    A single cc_balance occurrence, resolved in the correction pass
+    """
+    day: int = attr.ib()
+    date: datetime = attr.ib()
+    index: int = attr.ib()
+    cc_account: int = attr.ib()
+    postings: list = attr.ib()
+
+
+@attr.define(kw_only=True)
+class LinearProjection:
+    """
+    A spec compiled into a linear operator.
+
+    Every plain scheduled amount affects balances linearly: `flows` maps the vector of scheduled amounts to the daily
+    net flow of each account (rows are account x day, columns are scheduled items, values the signed number of
+    occurrences). Balances are the opening balance plus the running sum of flows, so re-evaluating new amounts is one
+    sparse matrix-vector product and a cumsum. Dynamic cc_balance payments depend on balances and are applied
+    afterwards in date order. Accruing accounts compound instead of a plain cumsum, which is still linear in the flows.
+    As in the ledger, their interest shows up at month ends.
+    """
+    start_date: str = attr.ib()
+    end_date: str = attr.ib()
+    days: pd.DatetimeIndex = attr.ib()
+    account_ids: list = attr.ib()
+    items: list = attr.ib()
+    amounts: np.ndarray = attr.ib()
+    opening: np.ndarray = attr.ib()
+    stmt: dict = attr.ib()
+    flows: SparseOperator = attr.ib()
+    dynamic: list = attr.ib(factory=list)
+    growth: dict = attr.ib(factory=dict)
+    carried: dict = attr.ib(factory=dict)
+
+    @classmethod
+    def from_spec(cls, spec, start_date, end_date, cursors=None, accounts: Accounts = None):
+        """
+        Compile a spec. Dates are generated once here and never again.
+
+        :param spec: dict
+        :param start_date: str
+        :param end_date: str
+        :param cursors: dict|None See ScheduledTransactions.from_spec()
+        :param accounts: Accounts|None Opening balances (and statement balances) replacing the spec's, e.g. restored
+                         from a checkpoint
+        :return: LinearProjection
+        """
+        start = dp.parse(start_date)
+        days = pd.date_range(start, dp.parse(end_date), freq='D')
+        account_ids = list(spec['accounts'].keys())
+        account_index = {a: i for i, a in enumerate(account_ids)}
+        state = {} if accounts is None else accounts.accounts
+        opening = np.array([float(state[a].balance if a in state else spec['accounts'][a]['balance'])
+                            for a in account_ids])
+        stmt = {account_index[a]: (float(state[a].stmt_balance if a in state else s['stmt_balance']),
+                                   s['stmt_close_dom'])
+                for a, s in spec['accounts'].items() if s['type'] == 'cc'}
+        growth = {account_index[a]: Accrual.from_spec(s['accrual']).get_factors(days)
+                  for a, s in spec['accounts'].items() if s['type'] != 'cc' and s.get('accrual')}
+        carried = {account_index[a]: float(state[a].accrued) for a in state if account_index[a] in growth}
+
+        calendar = BusinessCalendar.from_spec(spec.get('calendar'), start_date, end_date)
+        items, amounts, rows, cols, data, dynamic = [], [], [], [], [], []
+        for st, cursor in ScheduledTransactions.iterate_spec(spec, cursors):
+            _, dates = st.generate_posting_dates(start_date, end_date, cursor, calendar)
+            if len(dates) == 0:
+                continue
+            postings = [(account_index[a], sign) for a, sign in cls.get_postings(st)]
+            day_index = (pd.DatetimeIndex(dates) - start).days.to_numpy()
+            if type(st.amount) == dict:
+                cc_account = account_index[st.amount['cc_balance']['account_id']]
+                dynamic.extend(DynamicItem(day=day, date=d, index=i, cc_account=cc_account, postings=postings)
+                               for i, (day, d) in enumerate(zip(day_index, dates), start=cursor.index))
+                continue
+            col = len(items)
+            items.append((st.account_id, st.transaction_id))
+            amounts.append(abs(float(st.amount)))
+            for account, sign in postings:
+                rows.append(account * len(days) + day_index)
+                cols.append(np.full(len(day_index), col))
+                data.append(np.full(len(day_index), sign))
+        shape = (len(account_ids) * len(days), len(items))
+        flows = SparseOperator.from_triplets(np.concatenate(rows) if rows else [],
+                                             np.concatenate(cols) if cols else [],
+                                             np.concatenate(data) if data else [], shape)
+        return LinearProjection(start_date=start_date, end_date=end_date, days=days, account_ids=account_ids,
+                                items=items, amounts=np.array(amounts), opening=opening, stmt=stmt, flows=flows,
+                                dynamic=sorted(dynamic, key=lambda d: d.day), growth=growth,
+                                carried=carried)
+
+    @classmethod
+    def get_postings(cls, st: ScheduledTransaction) -> list:
+        """
+        Accounts touched by a scheduled transaction and the sign of the effect on each
+
+        :param st: ScheduledTransaction
+        :return: list of (account_id, sign)
+        """
+        if st.type == 'income':
+            return [(st.account_id, 1)]
+        if st.type == 'expense':
+            return [(st.account_id, -1)]
+        if st.transfer.direction == 'to':
+            return [(st.account_id, -1), (st.transfer.account_id, 1)]
+        if st.transfer.direction == 'from':
+            return [(st.transfer.account_id, -1), (st.account_id, 1)]
+        raise ValueError(f'Transfer direction must be one of "to", "from". Received: {st.transfer.direction}')
+
+    def get_amount_vector(self, amounts: Union[dict, None] = None) -> np.ndarray:
+        """
+        Default scheduled amounts with overrides applied
+
+        :param amounts: dict|None {(account_id, transaction_id): amount}
+        :return: np.ndarray
+        """
+        vector = self.amounts.copy()
+        for key, amount in (amounts or {}).items():
+            if key not in self.items:
+                raise KeyError(f'scheduled transaction not found or not a plain amount: {key}')
+            vector[self.items.index(key)] = abs(amount)
+        return vector
+
+    def evaluate_array(self, vector: np.ndarray) -> np.ndarray:
+        """
+        Balances as an (account x day) array for an amount vector
+
+        :param vector: np.ndarray
+        :return: np.ndarray
+        """
+        flows = self.flows.dot(vector).reshape(len(self.account_ids), len(self.days))
+        self.apply_dynamic(flows)
+        balances = self.opening[:, None] + np.cumsum(flows, axis=1)
+        for account, factors in self.growth.items():
+            # interest reaches the ledger as month end rows, so balances show it on the posting days only
+            accrued = Accrual.get_accrued(self.opening[account], flows[account], factors,
+                                          self.carried.get(account, 0.0))
+            balances[account] = self.opening[account] + np.cumsum(flows[account] + Accrual.post(accrued, self.days))
+        return balances
+
+    def apply_dynamic(self, flows: np.ndarray) -> None:
+        """
+        Correction pass for cc_balance payments, in date order so each sees the payments before it
+
+        Credit card accounts never accrue, so the statement balance is the opening balance plus flows to date.
+
+        :param flows: np.ndarray (account x day) Modified in place
+        :return:
+        """
+        start = self.days[0]
+        for item in self.dynamic:
+            stmt_balance, close_dom = self.stmt[item.cc_account]
+            close_date = item.date + drel(months=-1) + drel(day=close_dom)
+            if item.index == 0 or close_date < start:
+                balance = stmt_balance
+            else:
+                balance = self.opening[item.cc_account] + flows[item.cc_account, :(close_date - start).days + 1].sum()
+            amount = abs(balance)
+            for account, sign in item.postings:
+                flows[account, item.day] += sign * amount
+
+    def evaluate(self, amounts: Union[dict, None] = None) -> pd.DataFrame:
+        """
+        Daily end-of-day balances for every account
+
+        :param amounts: dict|None {(account_id, transaction_id): amount} overrides for plain scheduled amounts
+        :return: pd.DataFrame indexed by date with a column per account
+        """
+        balances = self.evaluate_array(self.get_amount_vector(amounts))
+        return pd.DataFrame(balances.T, index=self.days, columns=self.account_ids)
@@ -1,7 +1,23 @@
+import copy
+import threading
+from datetime import date
+from typing import Union
+
 import attr
+import dateutil.parser as dp
 import pandas as pd
+from dateutil.relativedelta import relativedelta
 
 from .account import Accounts
+from .aggregate import Aggregate
+from .attribution import Attribution
+from .checkpoint import Checkpoint
+from .datespec import DATE_FORMAT
+from .importer import Reconciliation
+from .linear import LinearProjection
+from .rollup import Rollup
+from .snapshot import ProjectionSnapshot
+from .store import ProjectionStore, build_lock, hash_spec
 from .transaction import ScheduledTransactions
 
 
@@ -10,6 +26,7 @@ class Chart:
     name: str = attr.ib()
     type: str = attr.ib()
     accounts: list = attr.ib()
+    options: dict = attr.ib(factory=dict)
 
 
 @attr.define(kw_only=True)
@@ -18,25 +35,260 @@ class Projector:
     start_date: str = attr.ib(factory=str)
     end_date: str = attr.ib(factory=str)
     accounts: Accounts = attr.ib()
+    reconciliation: Union[Reconciliation, None] = attr.ib(default=None)
+    cursors: dict = attr.ib(factory=dict)
+    start_cursors: dict = attr.ib(factory=dict)
+    snapshot: Union[ProjectionSnapshot, None] = attr.ib(default=None)
+    lock: threading.RLock = attr.ib(factory=threading.RLock)
+
+    @classmethod
+    def from_spec(cls, spec, start_date, end_date, actuals=None, cutoff=None):
+        """
+        Build a projection from the spec
+
+        :param spec: dict
+        :param start_date: str
+        :param end_date: str
+        :param actuals: pd.DataFrame|None Actual transactions, see TransactionImporter
+        :param cutoff: str|None Projected transactions before this date are replaced by actuals. Defaults to today.
+        :return: Projector
+        """
+        accounts = Accounts.from_spec(spec, start_date, end_date)
+        scheduled = ScheduledTransactions.from_spec(spec, start_date, end_date)
+        reconciliation = None
+        if actuals is not None:
+            cutoff = cutoff or date.today().strftime(DATE_FORMAT)
+            reconciliation = Reconciliation.from_actuals(scheduled, actuals, cutoff)
+            scheduled = reconciliation.scheduled
+            accounts.add_transactions_df('actuals', actuals)
+        accounts.apply_scheduled_transactions(scheduled)
+        accounts.apply_accruals(end_date)
+        return Projector(spec=spec, start_date=start_date, end_date=end_date, accounts=accounts,
+                         reconciliation=reconciliation, cursors=scheduled.cursors)
+
+    @classmethod
+    def from_store(cls, spec, start_date, end_date, directory):
+        """
+        Read-only projector backed by a memory mapped ProjectionStore
+
+        The first caller projects the spec and writes the store; later callers (e.g. other WSGI workers) map the
+        files and skip projecting. Callers arriving while the store is being built wait for it rather than building
+        their own. The store is rewritten when the spec or dates change. Only snapshot based methods
+        (get_snapshot(), get_rollup(), get_charts()) are available when the store was reused.
+
+        :param spec: dict
+        :param start_date: str
+        :param end_date: str
+        :param directory: str
+        :return: Projector
+        """
+        fingerprint = hash_spec(spec, start_date, end_date)
+        store = ProjectionStore.open(directory, fingerprint)
+        if store is None:
+            with build_lock(directory):
+                # another worker may have built it while this one waited for the lock
+                store = ProjectionStore.open(directory, fingerprint)
+                if store is None:
+                    # from_spec annotates the spec in place, which would change the fingerprint
+                    projector = Projector.from_spec(copy.deepcopy(spec), start_date, end_date)
+                    ProjectionStore.write(projector.publish(), directory, fingerprint)
+                    return projector
+        return Projector(spec=spec, start_date=start_date, end_date=end_date, accounts=Accounts(),
+                         snapshot=store.get_snapshot(aggregates=Aggregate.from_specs(spec)))
+
+    def extend(self, end_date):
+        """
+        Roll the horizon forward to end_date
+
+        Only occurrences after the current end_date are generated. Each scheduled transaction continues from its
+        cursor, so dynamic amounts pick up the right CCBalanceAmount.index and resolve against the existing ledger.
+
+        Runs under the publish lock. If a snapshot was already published, the extended projection is published in
+        its place; readers holding the old one keep it.
+
+        :param end_date: str
+        :return: Projector
+        """
+        with self.lock:
+            current_end = dp.parse(self.end_date)
+            if dp.parse(end_date) <= current_end:
+                raise ValueError(f'end_date must be after {self.end_date}. Received: {end_date}')
+            start_date = (current_end + relativedelta(days=1)).strftime(DATE_FORMAT)
+            scheduled = ScheduledTransactions.from_spec(self.spec, start_date, end_date, cursors=self.cursors)
+            self.accounts.apply_scheduled_transactions(scheduled)
+            self.accounts.apply_accruals(end_date)
+            self.cursors = scheduled.cursors
+            self.end_date = end_date
+            if self.snapshot is not None:
+                self.publish()
+        return self
 
     @classmethod
-    def from_spec(cls, spec, start_date, end_date):
+    def from_checkpoint(cls, spec, checkpoint: Checkpoint, end_date):
+        """
+        Resume a projection the day after a checkpoint
+
+        Opening balances come from the checkpoint rather than the spec and every schedule continues from its cursor,
+        so only the days after the checkpoint are processed.
+
+        :param spec: dict
+        :param checkpoint: Checkpoint
+        :param end_date: str
+        :return: Projector
+        """
+        start_date = (dp.parse(checkpoint.date) + relativedelta(days=1)).strftime(DATE_FORMAT)
         accounts = Accounts.from_spec(spec, start_date, end_date)
-        accounts.apply_scheduled_transactions(ScheduledTransactions.from_spec(spec, start_date, end_date))
-        return Projector(spec=spec, start_date=start_date, end_date=end_date, accounts=accounts)
+        accounts.restore(checkpoint.accounts)
+        scheduled = ScheduledTransactions.from_spec(spec, start_date, end_date, cursors=checkpoint.cursors)
+        accounts.apply_scheduled_transactions(scheduled)
+        accounts.apply_accruals(end_date)
+        return Projector(spec=spec, start_date=start_date, end_date=end_date, accounts=accounts,
+                         cursors=scheduled.cursors, start_cursors=checkpoint.cursors)
+
+    def checkpoint(self, date) -> Checkpoint:
+        """
+        Capture account state and schedule cursors as of the end of `date`
+
+        :param date: str
+        :return: Checkpoint
+        """
+        return Checkpoint.from_projector(self, date)
+
+    def compile(self) -> LinearProjection:
+        """
+        Compile the spec into a linear operator for fast re-evaluation of scheduled amounts
+
+        A projection resumed from a checkpoint compiles from its restored balances and cursors. Reconciled actuals
+        aren't scheduled amounts, so a projection with actuals can't be compiled.
+
+        :return: LinearProjection
+        """
+        if self.reconciliation is not None:
+            raise ValueError('a projection with actuals cannot be compiled')
+        return LinearProjection.from_spec(self.spec, self.start_date, self.end_date, cursors=self.start_cursors,
+                                          accounts=self.accounts)
 
     def get_account(self, account_id):
         return self.accounts.get_account(account_id)
 
+    def publish(self) -> ProjectionSnapshot:
+        """
+        Build a new immutable snapshot off to the side and swap it in
+
+        Readers holding the previous snapshot keep a consistent view. extend() republishes itself, call after any
+        other update.
+
+        :return: ProjectionSnapshot
+        """
+        with self.lock:
+            version = 1 if self.snapshot is None else self.snapshot.version + 1
+            snapshot = ProjectionSnapshot.from_projector(self, version)
+            # a single reference assignment, so readers see either the old snapshot or the new one
+            self.snapshot = snapshot
+            return snapshot
+
+    def get_snapshot(self) -> ProjectionSnapshot:
+        """
+        Current snapshot, published on first use. Safe to call from any thread.
+
+        :return: ProjectionSnapshot
+        """
+        snapshot = self.snapshot
+        if snapshot is None:
+            snapshot = self.publish()
+        return snapshot
+
+    def get_attribution(self, account_id, start_date=None, end_date=None) -> Attribution:
+        """
+        Break an account's balance change between two dates down by scheduled item
+
+        :param account_id: str
+        :param start_date: str|None Defaults to the start of the projection
+        :param end_date: str|None Defaults to the end of the projection
+        :return: Attribution
+        """
+        account = self.get_snapshot().get_account(account_id)
+        return Attribution.from_ledger(account_id, account.get_ledger_df(), account.balance,
+                                       start_date or self.start_date, end_date or self.end_date)
+
+    def get_rollup(self, account_ids=None, rollup: Rollup = None) -> pd.DataFrame:
+        """
+        Period totals by category for the given accounts (default all)
+
+        :param account_ids: list|None With net_transfers, transfers between these accounts are left out
+        :param rollup: Rollup|None Defaults to monthly totals by transaction type
+        :return: pd.DataFrame indexed by (account_id, period) with a column per category
+        """
+        snapshot = self.get_snapshot()
+        rollup = rollup or Rollup()
+        account_ids = list(snapshot.accounts.keys()) if account_ids is None else account_ids
+        ledger = Rollup.combine_ledgers([snapshot.get_account(a).get_ledger_df() for a in account_ids])
+        return rollup.compute(ledger, own_account_ids=account_ids)
+
+    def search(self, text=None, transaction_id=None, type=None, account_id=None, start_date=None,
+               end_date=None) -> pd.DataFrame:
+        """
+        Search transactions across all accounts
+
+        e.g. search(text='rent', start_date='2022-06-01', end_date='2022-12-31') or
+        search(type='transfer', account_id='credit_card')
+
+        :param text: str|None Words that must all appear in the transaction name, case insensitive
+        :param transaction_id: str|None
+        :param type: str|None
+        :param account_id: str|None Transactions in this account or with it as the counterparty
+        :param start_date: str|None
+        :param end_date: str|None
+        :return: pd.DataFrame with the ledger columns, sorted by date
+        """
+        return self.get_snapshot().search(text=text, transaction_id=transaction_id, type=type,
+                                          account_id=account_id, start_date=start_date, end_date=end_date)
+
     def get_charts(self):
+        snapshot = self.get_snapshot()
         charts = []
         for chart in self.spec['chart_spec']:
+            if chart['type'] == 'rollup':
+                rollup = Rollup.from_spec(chart)
+                pivot = self.get_rollup(chart['account_ids'], rollup)
+                accounts = [
+                    dict(name=snapshot.get_account(a).name,
+                         df=pivot.xs(a, level='account_id') if a in pivot.index.get_level_values('account_id')
+                         else pd.DataFrame())
+                    for a in chart['account_ids']
+                ]
+                charts.append(Chart(name=chart['name'], type=chart['type'], accounts=accounts,
+                                    options=attr.asdict(rollup)))
+                continue
+            if chart['type'] == 'waterfall':
+                start_date, end_date = chart.get('start_date'), chart.get('end_date')
+                accounts = [dict(name=snapshot.get_account(a).name,
+                                 df=self.get_attribution(a, start_date, end_date).get_waterfall_df())
+                            for a in chart['account_ids']]
+                charts.append(Chart(name=chart['name'], type=chart['type'], accounts=accounts,
+                                    options=dict(start_date=start_date or self.start_date,
+                                                 end_date=end_date or self.end_date)))
+                continue
+            if chart['type'] == 'line' and chart.get('resample'):
+                # aggregated view: one open/min/max/close row per period
+                accounts = [dict(name=snapshot.get_account(a).name,
+                                 df=snapshot.get_account(a).get_balance_ohlc(chart['resample']))
+                            for a in chart.get('account_ids', [])]
+                accounts += [dict(name=snapshot.get_aggregate(a).name, aggregate=True,
+                                  df=snapshot.get_aggregate(a).get_balance_ohlc(chart['resample']))
+                             for a in chart.get('aggregate_ids', [])]
+                charts.append(Chart(name=chart['name'], type=chart['type'], accounts=accounts,
+                                    options=dict(resample=chart['resample'])))
+                continue
             accounts = list(
                 map(
                     lambda a: dict(
-                        name=self.get_account(a).name,
-                        df=self.get_account(a).get_running_balance_grouped()), chart['account_ids']
+                        name=snapshot.get_account(a).name,
+                        df=snapshot.get_account(a).get_running_balance_grouped()), chart.get('account_ids', [])
                 )
             )
+            accounts += [dict(name=snapshot.get_aggregate(a).name, aggregate=True,
+                              df=snapshot.get_aggregate(a).get_running_balance_grouped())
+                         for a in chart.get('aggregate_ids', [])]
             charts.append(Chart(name=chart['name'], type=chart['type'], accounts=accounts))
         return charts
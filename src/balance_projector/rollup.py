@@ -0,0 +1,114 @@
+from typing import Union
+
+import attr
+import numpy as np
+import pandas as pd
+
+period_map = {
+    'daily':   'D',
+    'weekly':  'W',
+    'monthly': 'M',
+    'yearly':  'Y'
+}
+
+rollup_categories = ['type', 'transaction_id', 'name']
+
+OHLC_COLUMNS = ['open', 'min', 'max', 'close', 'net']
+
+
+def resample_balance(dates: pd.Series, amounts: pd.Series, balances: pd.Series, opening: float, period: str,
+                     start_date=None) -> pd.DataFrame:
+    """
+    Open/min/max/close balance and net flow per period from a running balance
+
+    Only end-of-day balances count towards min and max, since the order of transactions within a day is arbitrary.
+    Periods without transactions carry the previous close.
+
+    :param dates: pd.Series Transaction dates, sorted
+    :param amounts: pd.Series
+    :param balances: pd.Series Running balance after each transaction
+    :param opening: float Balance before the first transaction
+    :param period: str daily|weekly|monthly|yearly or a pandas period alias
+    :param start_date: str|None First period. Defaults to the period of the first transaction.
+    :return: pd.DataFrame indexed by period with OHLC_COLUMNS
+    """
+    freq = period_map.get(period, period)
+    dates = pd.Series(pd.to_datetime(np.asarray(dates)))
+    end_of_day = (dates != dates.shift(-1)).to_numpy()
+    periods = dates.dt.to_period(freq)
+    if start_date is not None:
+        first = pd.Timestamp(start_date).to_period(freq)
+    else:
+        first = periods.iloc[0] if len(periods) else None
+    if first is None:
+        return pd.DataFrame(columns=OHLC_COLUMNS, index=pd.PeriodIndex([], freq=freq, name='period'), dtype=float)
+    index = pd.period_range(first, max(first, periods.max()) if len(periods) else first, name='period')
+    eod = pd.Series(np.asarray(balances, dtype=float)[end_of_day]).groupby(periods[end_of_day].to_numpy())
+    close = eod.last().reindex(index).ffill().fillna(opening)
+    opens = close.shift(1).fillna(opening)
+    df = pd.DataFrame({
+        'open':  opens,
+        'min':   np.fmin(eod.min().reindex(index), opens),
+        'max':   np.fmax(eod.max().reindex(index), opens),
+        'close': close,
+        'net':   pd.Series(np.asarray(amounts, dtype=float)).groupby(periods.to_numpy()).sum()
+                   .reindex(index, fill_value=0.0)
+    }, index=index)
+    return df
+
+
+@attr.define(kw_only=True)
+class Rollup:
+    """
+    Period totals per account and category (transaction type, scheduled item or name).
+
+    One groupby over the combined ledger produces the whole account x period x category pivot.
+    """
+    period: str = attr.ib(default='monthly')
+    by: str = attr.ib(default='type')
+    net_transfers: bool = attr.ib(default=False)
+
+    @by.validator
+    def _check_by(self, attribute, value):
+        if value not in rollup_categories:
+            raise ValueError(f'Rollup category must be one of {rollup_categories}. Received: {value}')
+
+    @classmethod
+    def from_spec(cls, spec: dict):
+        return Rollup(period=spec.get('period', 'monthly'), by=spec.get('by', 'type'),
+                      net_transfers=spec.get('net_transfers', False))
+
+    @classmethod
+    def combine_ledgers(cls, ledgers: list) -> pd.DataFrame:
+        """
+        Stack account ledgers with categorical dtypes for the repeated string columns
+
+        :param ledgers: list of pd.DataFrame
+        :return: pd.DataFrame
+        """
+        ledgers = [df for df in ledgers if len(df.index) > 0]
+        if len(ledgers) == 0:
+            return pd.DataFrame(columns=['transaction_id', 'type', 'account_id', 'date', 'amount', 'name',
+                                         'counterparty_id']).astype({'date': 'datetime64[ns]', 'amount': float})
+        df = pd.concat(ledgers, ignore_index=True)
+        for column in ['transaction_id', 'type', 'account_id', 'name']:
+            df[column] = df[column].astype('category')
+        return df
+
+    def compute(self, ledger: pd.DataFrame, own_account_ids: Union[list, None] = None) -> pd.DataFrame:
+        """
+        :param ledger: pd.DataFrame Combined ledger, see combine_ledgers()
+        :param own_account_ids: list|None Accounts whose transfers between each other are netted out when
+                                net_transfers is set. Defaults to the accounts in the ledger.
+        :return: pd.DataFrame indexed by (account_id, period) with a column per category
+        """
+        if self.net_transfers:
+            own = ledger['account_id'].unique() if own_account_ids is None else own_account_ids
+            internal = (ledger['type'] == 'transfer') & ledger['counterparty_id'].isin(own)
+            ledger = ledger[~internal]
+        period = ledger['date'].dt.to_period(period_map.get(self.period, self.period)).rename('period')
+        pivot = (ledger.groupby(['account_id', period, self.by], observed=True)['amount']
+                 .sum()
+                 .unstack(self.by, fill_value=0.0))
+        pivot.columns = pivot.columns.astype(str)
+        return pivot
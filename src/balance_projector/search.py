@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import re
+from typing import Union
+
+import attr
+import dateutil.parser as dp
+import numpy as np
+import pandas as pd
+
+from .account import LEDGER_COLUMNS
+
+TOKEN_PATTERN = r'\w+'
+
+search_fields = ['name', 'transaction_id', 'type', 'account']
+
+
+def tokenize(text: str) -> list:
+    return re.findall(TOKEN_PATTERN, text.lower())
+
+
+@attr.define(kw_only=True)
+class TransactionIndex:
+    """
+    Search index over the ledgers of every account.
+
+    Rows are the combined ledger sorted by date, so positions double as a date ordering: a date range is one
+    searchsorted on dates, and since every postings list is sorted, pruning it to the range is one more. Postings map
+    a lower-cased name token, transaction_id, type or account (the row's own account or its counterparty) to the rows
+    that carry it.
+    """
+    ledger: pd.DataFrame = attr.ib()
+    dates: np.ndarray = attr.ib()
+    postings: dict = attr.ib(factory=dict)
+
+    @classmethod
+    def from_ledgers(cls, ledgers: list) -> TransactionIndex:
+        """
+        :param ledgers: list of pd.DataFrame with LEDGER_COLUMNS
+        :return: TransactionIndex
+        """
+        ledgers = [df for df in ledgers if len(df.index) > 0]
+        if len(ledgers) == 0:
+            ledger = pd.DataFrame(columns=LEDGER_COLUMNS).astype({'date': 'datetime64[ns]', 'amount': float})
+        else:
+            ledger = pd.concat(ledgers, ignore_index=True)
+        ledger = ledger.sort_values('date', kind='stable', ignore_index=True)
+        positions = pd.RangeIndex(len(ledger.index))
+        tokens = ledger['name'].astype(str).str.lower().str.findall(TOKEN_PATTERN).explode().dropna()
+        accounts = pd.concat([ledger['account_id'].astype(object), ledger['counterparty_id'].astype(object)]).dropna()
+        postings = {
+            'name': cls.group_positions(tokens, tokens.index),
+            'transaction_id': cls.group_positions(ledger['transaction_id'].astype(object), positions),
+            'type': cls.group_positions(ledger['type'].astype(object), positions),
+            'account': cls.group_positions(accounts, accounts.index)
+        }
+        return TransactionIndex(ledger=ledger, dates=ledger['date'].to_numpy(dtype='datetime64[ns]'),
+                                postings=postings)
+
+    @classmethod
+    def group_positions(cls, keys: pd.Series, positions) -> dict:
+        """
+        :param keys: pd.Series
+        :param positions: array-like Row position for each key
+        :return: dict key -> sorted np.ndarray of unique row positions
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        return {key: np.unique(positions[i]) for key, i in keys.groupby(keys.values).indices.items()}
+
+    def get_postings(self, field: str, value: str) -> np.ndarray:
+        if field not in search_fields:
+            raise ValueError(f'Search field must be one of {search_fields}. Received: {field}')
+        return self.postings[field].get(value, np.empty(0, dtype=np.int64))
+
+    def get_date_range(self, start_date=None, end_date=None) -> tuple:
+        lo = 0 if start_date is None else np.searchsorted(self.dates, np.datetime64(dp.parse(start_date), 'ns'),
+                                                          side='left')
+        hi = len(self.dates) if end_date is None else np.searchsorted(
+            self.dates, np.datetime64(dp.parse(end_date), 'ns'), side='right')
+        return int(lo), int(hi)
+
+    def search_positions(self, text: Union[str, None] = None, transaction_id=None, type=None, account_id=None,
+                         start_date=None, end_date=None) -> np.ndarray:
+        """
+        Row positions matching every given filter
+
+        :param text: str|None Every token must appear in the transaction name
+        :param transaction_id: str|None
+        :param type: str|None
+        :param account_id: str|None Matches the row's account or its counterparty
+        :param start_date: str|None
+        :param end_date: str|None
+        :return: np.ndarray sorted by date
+        """
+        lo, hi = self.get_date_range(start_date, end_date)
+        lists = [self.get_postings('name', token) for token in tokenize(text or '')]
+        for field, value in [('transaction_id', transaction_id), ('type', type), ('account', account_id)]:
+            if value is not None:
+                lists.append(self.get_postings(field, value))
+        if len(lists) == 0:
+            return np.arange(lo, hi, dtype=np.int64)
+        # prune each list to the date range before intersecting, smallest first
+        lists = sorted((p[np.searchsorted(p, lo):np.searchsorted(p, hi)] for p in lists), key=len)
+        result = lists[0]
+        for postings in lists[1:]:
+            if len(result) == 0:
+                break
+            result = np.intersect1d(result, postings, assume_unique=True)
+        return result
+
+    def search(self, **query) -> pd.DataFrame:
+        """
+        Ledger rows from any account matching the query, see search_positions()
+
+        :return: pd.DataFrame with LEDGER_COLUMNS
+        """
+        return self.ledger.iloc[self.search_positions(**query)]
@@ -0,0 +1,177 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import Union
+from urllib.parse import urlsplit, parse_qsl
+
+import attr
+import dateutil.parser as dp
+
+from .cache import LRUCache
+from .datespec import DATE_FORMAT
+from .exceptions import AccountNotFoundException, OutOfBoundsException, QueryException
+from .projector import Projector
+from .store import hash_spec
+
+MAX_BODY_SIZE = 1024 * 1024
+
+
+def df_to_records(df, date_column='date') -> list:
+    if date_column not in df.columns:
+        df = df.reset_index()
+    df[date_column] = df[date_column].dt.strftime(DATE_FORMAT)
+    return df.to_dict(orient='records')
+
+
+@attr.define(kw_only=True)
+class QueryService:
+    """
+    The Projector query surface as JSON-friendly queries.
+
+    Queries run against the projector's published snapshot on a thread pool, so the event loop never does pandas
+    work. Responses are cached by (spec hash, snapshot version, query).
+    """
+    projector: Projector = attr.ib()
+    spec_hash: str = attr.ib()
+    cache: LRUCache = attr.ib(factory=LRUCache)
+    executor: ThreadPoolExecutor = attr.ib(factory=ThreadPoolExecutor)
+
+    @classmethod
+    def from_projector(cls, projector: Projector, cache_size=1024, workers=None):
+        return QueryService(projector=projector,
+                            spec_hash=hash_spec(projector.spec, projector.start_date, projector.end_date),
+                            cache=LRUCache(maxsize=cache_size), executor=ThreadPoolExecutor(max_workers=workers))
+
+    def run_query(self, query: dict) -> Union[dict, list]:
+        """
+        Answer a single query. CPU bound, runs on the executor.
+
+        :param query: dict with a "type" of accounts|balance|ledger
+        :return: dict|list
+        """
+        snapshot = self.projector.get_snapshot()
+        qtype = query.get('type')
+        try:
+            if qtype == 'accounts':
+                return [{'account_id': a.account_id, 'name': a.name} for a in snapshot.accounts.values()]
+            if qtype == 'balance':
+                account = snapshot.get_account(query['account_id'])
+                return {'account_id': account.account_id, 'date': query['date'],
+                        'balance': account.get_balance(query['date'])}
+            if qtype == 'ledger':
+                account = snapshot.get_account(query['account_id'])
+                grouped = str(query.get('grouped', False)).lower() in ['1', 'true']
+                df = account.get_running_balance_grouped() if grouped else account.get_running_balance()
+                dates = df.index if grouped else df['date']
+                mask = dates >= dp.parse(query.get('start_date', snapshot.start_date))
+                mask &= dates <= dp.parse(query.get('end_date', snapshot.end_date))
+                df = df[mask]
+                return df_to_records(df)
+        except KeyError as e:
+            raise QueryException(HTTPStatus.BAD_REQUEST, f'missing parameter: {e}')
+        except AccountNotFoundException as e:
+            raise QueryException(HTTPStatus.NOT_FOUND, str(e))
+        except (OutOfBoundsException, ValueError, TypeError) as e:
+            raise QueryException(HTTPStatus.BAD_REQUEST, str(e))
+        raise QueryException(HTTPStatus.BAD_REQUEST, f'unknown query type: {qtype}')
+
+    async def query(self, query: dict) -> Union[dict, list]:
+        if not isinstance(query, dict):
+            raise QueryException(HTTPStatus.BAD_REQUEST, 'query must be a JSON object')
+        version = self.projector.get_snapshot().version
+        key = (self.spec_hash, version, json.dumps(query, sort_keys=True, default=str))
+        result = self.cache.get(key)
+        if result is None:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self.executor, self.run_query, query)
+            self.cache.put(key, result)
+        return result
+
+    async def query_many(self, queries: list) -> list:
+        """
+        Answer a batch of queries concurrently. A failing query doesn't fail the batch.
+
+        :param queries: list of dict
+        :return: list of {"result": ...} or {"error": ...}
+        """
+        async def run(q):
+            try:
+                return {'result': await self.query(q)}
+            except QueryException as e:
+                return {'error': str(e), 'status': int(e.status)}
+        return list(await asyncio.gather(*map(run, queries)))
+
+
+@attr.define(kw_only=True)
+class QueryServer:
+    """
+    Minimal HTTP/1.1 JSON API over QueryService.
+
+    GET  /accounts
+    GET  /balance?account_id=checking&date=2022-06-30
+    GET  /ledger?account_id=checking&start_date=2022-01-01&end_date=2022-06-30&grouped=true
+    POST /query with a query object, or {"queries": [...]} for a batch
+    """
+    service: QueryService = attr.ib()
+
+    async def dispatch(self, method: str, target: str, body: bytes) -> Union[dict, list]:
+        url = urlsplit(target)
+        path = url.path.strip('/')
+        if method == 'GET' and path in ['accounts', 'balance', 'ledger']:
+            return await self.service.query(dict(parse_qsl(url.query), type=path))
+        if method == 'POST' and path == 'query':
+            try:
+                payload = json.loads(body or b'{}')
+            except ValueError:
+                raise QueryException(HTTPStatus.BAD_REQUEST, 'request body must be JSON')
+            if isinstance(payload, dict) and 'queries' in payload:
+                if not isinstance(payload['queries'], list):
+                    raise QueryException(HTTPStatus.BAD_REQUEST, 'queries must be a JSON array')
+                return await self.service.query_many(payload['queries'])
+            return await self.service.query(payload)
+        raise QueryException(HTTPStatus.NOT_FOUND, f'no route for {method} /{path}')
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            method, target, _ = request_line.decode('latin-1').split(' ', 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in [b'\r\n', b'\n', b'']:
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get('content-length', 0))
+            if length > MAX_BODY_SIZE:
+                raise QueryException(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, 'request body too large')
+            body = await reader.readexactly(length) if length else b''
+            status, payload = HTTPStatus.OK, await self.dispatch(method, target, body)
+        except QueryException as e:
+            status, payload = e.status, {'error': str(e)}
+        except (ValueError, TypeError, EOFError):
+            status, payload = HTTPStatus.BAD_REQUEST, {'error': 'malformed request'}
+        except Exception:
+            status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': 'internal error'}
+        data = json.dumps(payload, default=str).encode()
+        try:
+            writer.write(f'HTTP/1.1 {status.value} {status.phrase}\r\n'
+                         f'Content-Type: application/json\r\n'
+                         f'Content-Length: {len(data)}\r\n'
+                         f'Connection: close\r\n\r\n'.encode('latin-1') + data)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host='127.0.0.1', port=8051) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self.handle, host, port)
+
+    def serve_forever(self, host='127.0.0.1', port=8051):
+        async def main():
+            server = await self.start(host, port)
+            async with server:
+                await server.serve_forever()
+        asyncio.run(main())
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import threading
+from types import MappingProxyType
+from typing import TYPE_CHECKING
+
+import attr
+import dateutil.parser as dp
+import numpy as np
+import pandas as pd
+
+from .aggregate import Aggregate, AggregateSnapshot, compute_aggregates
+from .exceptions import AccountNotFoundException, AggregateNotFoundException, OutOfBoundsException
+from .rollup import resample_balance
+from .search import TransactionIndex
+
+if TYPE_CHECKING:
+    from .account import Account
+    from .projector import Projector
+
+
+def freeze(array) -> np.ndarray:
+    """
+    Read-only copy of an array
+
+    :param array: array-like
+    :return: np.ndarray
+    """
+    array = np.array(array, copy=True)
+    array.flags.writeable = False
+    return array
+
+
+@attr.define(frozen=True, kw_only=True)
+class AccountSnapshot:
+    """
+    Everything needed to answer queries about one account, computed up front.
+
+    Arrays are read-only. DataFrames are handed out as shallow copies, which pandas copy-on-write (always on from
+    pandas 3, required in setup.py) makes free until the caller modifies them, so callers can never change what other
+    threads see.
+    """
+    account_id: str = attr.ib()
+    name: str = attr.ib()
+    start_date: np.datetime64 = attr.ib()
+    balance: float = attr.ib()
+    dates: np.ndarray = attr.ib()
+    balances: np.ndarray = attr.ib()
+    transactions_df: pd.DataFrame = attr.ib()
+    ledger_df: pd.DataFrame = attr.ib()
+    running_balance: pd.DataFrame = attr.ib()
+    running_balance_grouped: pd.DataFrame = attr.ib()
+    ohlc: dict = attr.ib(factory=dict)
+
+    @classmethod
+    def from_account(cls, account: Account) -> AccountSnapshot:
+        grouped = account.get_running_balance_grouped().copy(deep=True)
+        return AccountSnapshot(account_id=account.account_id, name=account.name,
+                               start_date=np.datetime64(dp.parse(account.start_date), 'ns'),
+                               balance=float(account.balance),
+                               dates=freeze(grouped.index.to_numpy(dtype='datetime64[ns]')),
+                               balances=freeze(grouped['balance'].to_numpy(dtype=float)),
+                               transactions_df=account.get_transactions_df().copy(deep=True),
+                               ledger_df=account.get_ledger_df().copy(deep=True),
+                               running_balance=account.get_running_balance(),
+                               running_balance_grouped=grouped)
+
+    def get_balance(self, date) -> float:
+        """
+        Get balance for a date
+
+        :param date: str
+        :return: float
+        """
+        target_date = np.datetime64(dp.parse(date), 'ns')
+        if target_date < self.start_date:
+            raise OutOfBoundsException(f'date {target_date} before start_date of the account: {self.start_date}')
+        position = np.searchsorted(self.dates, target_date, side='right')
+        if position == 0:
+            return self.balance
+        return float(self.balances[position - 1])
+
+    def get_transactions_df(self) -> pd.DataFrame:
+        return self.transactions_df.copy(deep=False)
+
+    def get_ledger_df(self) -> pd.DataFrame:
+        return self.ledger_df.copy(deep=False)
+
+    def get_running_balance(self) -> pd.DataFrame:
+        return self.running_balance.copy(deep=False)
+
+    def get_running_balance_grouped(self) -> pd.DataFrame:
+        return self.running_balance_grouped.copy(deep=False)
+
+    def get_balance_ohlc(self, period='monthly') -> pd.DataFrame:
+        """
+        See Account.get_balance_ohlc(). Computed on first use and kept for the life of the snapshot.
+
+        :param period: str
+        :return: pd.DataFrame
+        """
+        if period not in self.ohlc:
+            df = self.running_balance
+            self.ohlc[period] = resample_balance(df['date'], df['amount'], df['balance'], self.balance, period,
+                                                 self.start_date)
+        return self.ohlc[period].copy(deep=False)
+
+
+@attr.define(frozen=True, kw_only=True)
+class ProjectionSnapshot:
+    """
+    Immutable view of a whole projection. Any number of threads may read it without locks.
+
+    The search index is built on the first search, so snapshots that are never searched (e.g. store-backed ones in
+    workers that only draw charts) don't pay for it.
+    """
+    version: int = attr.ib()
+    start_date: str = attr.ib()
+    end_date: str = attr.ib()
+    accounts: MappingProxyType = attr.ib()
+    aggregates: MappingProxyType = attr.ib(factory=lambda: MappingProxyType({}))
+    index: dict = attr.ib(factory=dict)
+    index_lock: threading.Lock = attr.ib(factory=threading.Lock)
+
+    @classmethod
+    def from_projector(cls, projector: Projector, version: int) -> ProjectionSnapshot:
+        accounts = {account_id: AccountSnapshot.from_account(account)
+                    for account_id, account in projector.accounts.accounts.items()}
+        aggregates = compute_aggregates(Aggregate.from_specs(projector.spec), accounts)
+        return ProjectionSnapshot(version=version, start_date=projector.start_date, end_date=projector.end_date,
+                                  accounts=MappingProxyType(accounts), aggregates=MappingProxyType(aggregates))
+
+    def get_account(self, account_id) -> AccountSnapshot:
+        account = self.accounts.get(account_id, None)
+        if account is None:
+            raise AccountNotFoundException(f'account not found: {account_id}')
+        return account
+
+    def get_aggregate(self, aggregate_id) -> AggregateSnapshot:
+        aggregate = self.aggregates.get(aggregate_id, None)
+        if aggregate is None:
+            raise AggregateNotFoundException(f'aggregate not found: {aggregate_id}')
+        return aggregate
+
+    def get_index(self) -> TransactionIndex:
+        if 'index' not in self.index:
+            # built once, concurrent first searches wait for it
+            with self.index_lock:
+                if 'index' not in self.index:
+                    self.index['index'] = TransactionIndex.from_ledgers([a.ledger_df for a in self.accounts.values()])
+        return self.index['index']
+
+    def search(self, **query) -> pd.DataFrame:
+        """
+        Transactions across all accounts, see TransactionIndex.search_positions()
+
+        :return: pd.DataFrame
+        """
+        return self.get_index().search(**query).copy(deep=False)
@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from types import MappingProxyType
+from typing import Union
+
+import attr
+import numpy as np
+import pandas as pd
+
+from .account import LEDGER_COLUMNS, TRANSACTIONS_DF_COLUMNS
+from .aggregate import compute_aggregates
+from .snapshot import AccountSnapshot, ProjectionSnapshot
+
+try:
+    import fcntl
+except ImportError:
+    # not on Windows, where build_lock() doesn't lock
+    fcntl = None
+
+MANIFEST_FILE = 'manifest.json'
+LOCK_SUFFIX = '.lock'
+STORE_FORMAT = 1
+
+
+def hash_spec(spec: dict, start_date: str, end_date: str) -> str:
+    payload = json.dumps([spec, start_date, end_date], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+@contextlib.contextmanager
+def build_lock(directory: str):
+    """
+    Exclusive lock for building or replacing the store in directory, across processes
+
+    An flock on a lock file next to the directory, so it is released if the holder dies.
+
+    :param directory: str
+    """
+    directory = os.path.abspath(directory)
+    os.makedirs(os.path.dirname(directory), exist_ok=True)
+    with open(directory + LOCK_SUFFIX, 'a') as stream:
+        if fcntl is not None:
+            fcntl.flock(stream.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(stream.fileno(), fcntl.LOCK_UN)
+
+
+def encode_column(series: pd.Series) -> tuple:
+    """
+    Column as a fixed width array plus the metadata needed to decode it
+
+    Dates are stored as int64 nanoseconds and strings as int32 category codes (-1 for missing), so every column
+    can be memory mapped.
+
+    :param series: pd.Series
+    :return: tuple (np.ndarray, dict)
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.to_numpy(dtype='datetime64[ns]').view(np.int64), {'kind': 'datetime'}
+    if pd.api.types.is_numeric_dtype(series):
+        return series.to_numpy(dtype=float), {'kind': 'float'}
+    categorical = pd.Categorical(series.astype(object).where(series.notna(), None))
+    return (categorical.codes.astype(np.int32),
+            {'kind': 'category', 'categories': [str(c) for c in categorical.categories]})
+
+
+def decode_column(array: np.ndarray, meta: dict):
+    if meta['kind'] == 'datetime':
+        return array.view('datetime64[ns]')
+    if meta['kind'] == 'category':
+        return pd.Categorical.from_codes(array, categories=meta['categories'])
+    return array
+
+
+@attr.define(kw_only=True)
+class ProjectionStore:
+    """
+    A published projection written once as memory mappable column files.
+
+    Every account gets a ledger table (LEDGER_COLUMNS plus the running balance) and a grouped table (one row per
+    date), one .npy file per column. Readers open the files with mmap_mode='r', so any number of worker processes
+    share the same physical pages and start without projecting anything. Only category labels are loaded into each
+    process.
+    """
+    directory: str = attr.ib()
+    manifest: dict = attr.ib(factory=dict)
+
+    @classmethod
+    def write(cls, snapshot: ProjectionSnapshot, directory: str, fingerprint: str) -> ProjectionStore:
+        """
+        Write the snapshot to directory, replacing whatever is there
+
+        Files go to a temporary directory first and are renamed into place, so readers never see a partial store. An
+        existing store is renamed aside before its files are deleted; readers that already mapped them keep their
+        pages. Concurrent writers must hold build_lock().
+
+        :param snapshot: ProjectionSnapshot
+        :param directory: str
+        :param fingerprint: str See hash_spec()
+        :return: ProjectionStore
+        """
+        directory = os.path.abspath(directory)
+        parent = os.path.dirname(directory)
+        os.makedirs(parent, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix='.store-', dir=parent)
+        try:
+            accounts = []
+            for account_id, account in snapshot.accounts.items():
+                ledger = account.get_ledger_df().reset_index(drop=True)
+                ledger['balance'] = account.get_running_balance()['balance'].to_numpy(dtype=float)
+                grouped = account.get_running_balance_grouped().reset_index()
+                accounts.append({
+                    'account_id': account_id,
+                    'name': account.name,
+                    'start_date': str(account.start_date),
+                    'balance': account.balance,
+                    'tables': {
+                        'ledger': cls.write_table(ledger, os.path.join(staging, account_id, 'ledger')),
+                        'grouped': cls.write_table(grouped, os.path.join(staging, account_id, 'grouped'))
+                    }
+                })
+            manifest = {'format': STORE_FORMAT, 'fingerprint': fingerprint, 'start_date': snapshot.start_date,
+                        'end_date': snapshot.end_date, 'accounts': accounts}
+            with open(os.path.join(staging, MANIFEST_FILE), 'w') as stream:
+                json.dump(manifest, stream)
+            retired = None
+            if os.path.exists(directory):
+                retired = staging + '.old'
+                os.replace(directory, retired)
+            os.replace(staging, directory)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        if retired is not None:
+            shutil.rmtree(retired, ignore_errors=True)
+        return ProjectionStore(directory=directory, manifest=manifest)
+
+    @classmethod
+    def write_table(cls, df: pd.DataFrame, path: str) -> dict:
+        os.makedirs(path, exist_ok=True)
+        columns = {}
+        for column in df.columns:
+            array, meta = encode_column(df[column])
+            np.save(os.path.join(path, f'{column}.npy'), array, allow_pickle=False)
+            columns[column] = meta
+        return {'rows': len(df.index), 'columns': columns}
+
+    @classmethod
+    def open(cls, directory: str, fingerprint: Union[str, None] = None) -> Union[ProjectionStore, None]:
+        """
+        Open an existing store
+
+        :param directory: str
+        :param fingerprint: str|None When given, a store written for a different spec or date range is ignored
+        :return: ProjectionStore|None
+        """
+        try:
+            with open(os.path.join(directory, MANIFEST_FILE), 'r') as stream:
+                manifest = json.load(stream)
+        except (FileNotFoundError, ValueError):
+            return None
+        if manifest.get('format') != STORE_FORMAT:
+            return None
+        if fingerprint is not None and manifest.get('fingerprint') != fingerprint:
+            return None
+        return ProjectionStore(directory=os.path.abspath(directory), manifest=manifest)
+
+    def read_table(self, account_id: str, table: str) -> pd.DataFrame:
+        meta = next(a for a in self.manifest['accounts'] if a['account_id'] == account_id)['tables'][table]
+        path = os.path.join(self.directory, account_id, table)
+        data = {column: decode_column(np.load(os.path.join(path, f'{column}.npy'), mmap_mode='r',
+                                              allow_pickle=False), column_meta)
+                for column, column_meta in meta['columns'].items()}
+        return pd.DataFrame(data, copy=False)
+
+    def get_snapshot(self, version: int = 1, aggregates: Union[list, None] = None) -> ProjectionSnapshot:
+        """
+        Snapshot backed by the mapped files
+
+        :param version: int
+        :param aggregates: list|None of Aggregate, computed from the mapped balances
+        :return: ProjectionSnapshot
+        """
+        accounts = {}
+        for meta in self.manifest['accounts']:
+            account_id = meta['account_id']
+            ledger = self.read_table(account_id, 'ledger')
+            grouped = self.read_table(account_id, 'grouped').set_index('date')
+            accounts[account_id] = AccountSnapshot(
+                account_id=account_id, name=meta['name'],
+                start_date=np.datetime64(meta['start_date'], 'ns'),
+                balance=float(meta['balance']),
+                dates=grouped.index.to_numpy(dtype='datetime64[ns]'),
+                balances=grouped['balance'].to_numpy(),
+                transactions_df=ledger[TRANSACTIONS_DF_COLUMNS],
+                ledger_df=ledger[LEDGER_COLUMNS],
+                running_balance=ledger[TRANSACTIONS_DF_COLUMNS + ['balance']],
+                running_balance_grouped=grouped)
+        return ProjectionSnapshot(version=version, start_date=self.manifest['start_date'],
+                                  end_date=self.manifest['end_date'], accounts=MappingProxyType(accounts),
+                                  aggregates=MappingProxyType(compute_aggregates(aggregates, accounts)))
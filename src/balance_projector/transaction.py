@@ -1,15 +1,21 @@
 from __future__ import annotations
 
+from datetime import datetime
 from typing import Union, TYPE_CHECKING
 
 import attr
+import dateutil.parser as dp
 from dateutil.relativedelta import relativedelta as drel
 
+from .busday import BusinessCalendar
 from .datespec import DateSpec, DATE_FORMAT
 
 if TYPE_CHECKING:
     from .account import Accounts
 
+# How far either side of a window to look for scheduled dates that a business day roll moves into it
+ROLL_PADDING_DAYS = 7
+
 
 @attr.define(kw_only=True)
 class Transfer:
@@ -25,6 +31,37 @@ class Transaction:
     amount: float = attr.ib()
     name: str = attr.ib()
     type: str = attr.ib()
+    counterparty_id: Union[str, None] = attr.ib(default=None)
+
+
+@attr.define(kw_only=True)
+class JournalEntry:
+    """
+    One transfer between two accounts, recorded once.
+
+    amount is always positive and moves from from_account_id to to_account_id. Each account's ledger sees its side
+    of the entry through Journal.get_account_view().
+    """
+    transaction_id: str = attr.ib()
+    type: str = attr.ib()
+    date: str = attr.ib()
+    amount: float = attr.ib()
+    name: str = attr.ib()
+    from_account_id: str = attr.ib()
+    to_account_id: str = attr.ib()
+
+    def get_transactions(self) -> list:
+        """
+        The debit and credit legs as separate transactions
+
+        :return: list of Transaction
+        """
+        return [
+            Transaction(transaction_id=self.transaction_id, type=self.type, account_id=self.from_account_id,
+                        date=self.date, amount=-self.amount, name=self.name, counterparty_id=self.to_account_id),
+            Transaction(transaction_id=self.transaction_id, type=self.type, account_id=self.to_account_id,
+                        date=self.date, amount=self.amount, name=self.name, counterparty_id=self.from_account_id)
+        ]
 
 
 @attr.define(kw_only=True)
@@ -48,7 +85,8 @@ class DynamicTransaction(Transaction):
         account = accounts.get_account(amount.account_id)
         last_month = self.date + drel(months=-1)
         close_date = last_month + drel(day=account.stmt_close_dom)
-        if amount.index == 0:
+        if amount.index == 0 or close_date < dp.parse(account.start_date):
+            # The statement closed before the projection started (e.g. resumed from a checkpoint).
             balance = account.stmt_balance
         else:
             balance = account.get_balance(close_date.strftime(DATE_FORMAT))
@@ -60,22 +98,88 @@ class DynamicTransaction(Transaction):
         return t
 
 
+@attr.define(frozen=True, kw_only=True)
+class ScheduleCursor:
+    """
+    How far a ScheduledTransaction has been generated.
+
+    index is the number of occurrences generated so far (CCBalanceAmount.index of the next occurrence),
+    last_date the most recent occurrence.
+    """
+    index: int = attr.ib(default=0)
+    last_date: Union[datetime, None] = attr.ib(default=None)
+
+    def advance(self, dates: list) -> ScheduleCursor:
+        if len(dates) == 0:
+            return self
+        return ScheduleCursor(index=self.index + len(dates), last_date=dates[-1])
+
+
 @attr.define(kw_only=True)
 class ScheduledTransactions:
     plain: list = attr.ib(factory=list)
     dynamic: list = attr.ib(factory=list)
+    cursors: dict = attr.ib(factory=dict)
 
     @classmethod
-    def from_spec(cls, spec, start_date, end_date):
+    def from_spec(cls, spec, start_date, end_date, cursors=None):
+        """
+        Generate transactions for every scheduled transaction in the spec
+
+        :param spec: dict
+        :param start_date: str
+        :param end_date: str
+        :param cursors: dict|None {account_id: {transaction_id: ScheduleCursor}} from a previous window.
+                        Generation continues from these rather than from the start of each date spec.
+        :return: ScheduledTransactions
+        """
+        calendar = BusinessCalendar.from_spec(spec.get('calendar'), start_date, end_date)
         transactions = []
+        next_cursors = {}
+        for st, cursor in cls.iterate_spec(spec, cursors):
+            scheduled, dates = st.generate_posting_dates(start_date, end_date, cursor, calendar)
+            transactions.extend(st.create_transactions(dates, cursor.index))
+            next_cursors.setdefault(st.account_id, {})[st.transaction_id] = cursor.advance(scheduled)
+        plain = [t for t in transactions if not isinstance(t, DynamicTransaction)]
+        dynamic = [t for t in transactions if isinstance(t, DynamicTransaction)]
+        return ScheduledTransactions(plain=plain, dynamic=dynamic, cursors=next_cursors)
+
+    @classmethod
+    def advance_cursors(cls, spec, start_date, end_date, cursors=None) -> dict:
+        """
+        Move cursors through a window without creating any transactions
+
+        Cursors only pass occurrences that post inside the window, so one rolled past end_date is still generated by
+        the next window.
+
+        :param spec: dict
+        :param start_date: str
+        :param end_date: str
+        :param cursors: dict|None
+        :return: dict
+        """
+        calendar = BusinessCalendar.from_spec(spec.get('calendar'), start_date, end_date)
+        next_cursors = {}
+        for st, cursor in cls.iterate_spec(spec, cursors):
+            scheduled, _ = st.generate_posting_dates(start_date, end_date, cursor, calendar)
+            next_cursors.setdefault(st.account_id, {})[st.transaction_id] = cursor.advance(scheduled)
+        return next_cursors
+
+    @classmethod
+    def iterate_spec(cls, spec, cursors=None):
+        """
+        Yield each ScheduledTransaction in the spec with its cursor
+
+        :param spec: dict
+        :param cursors: dict|None
+        :return: generator of (ScheduledTransaction, ScheduleCursor)
+        """
+        cursors = cursors or {}
         for account_id, account_spec in spec['accounts'].items():
             if account_spec['scheduled_transactions']:
                 for trans_id, trans in account_spec['scheduled_transactions'].items():
                     st = ScheduledTransaction.from_spec(account_id, trans_id, trans)
-                    transactions.extend(st.generate_transactions(start_date, end_date))
-        plain = [t for t in transactions if type(t).__name__ == 'Transaction']
-        dynamic = [t for t in transactions if type(t).__name__ == 'DynamicTransaction']
-        return ScheduledTransactions(plain=plain, dynamic=dynamic)
+                    yield st, cursors.get(account_id, {}).get(trans_id, ScheduleCursor())
 
 
 @attr.define(kw_only=True)
@@ -97,7 +201,8 @@ class ScheduledTransaction:
                                   date_spec=DateSpec.from_spec(spec['date_spec']), transfer=transfer)
         return st
 
-    def generate_transactions(self, start_date, end_date):
+    def generate_transactions(self, start_date, end_date, cursor: ScheduleCursor = None,
+                              calendar: BusinessCalendar = None):
         """
         Generate transactions
 
@@ -105,11 +210,62 @@ class ScheduledTransaction:
 
         :param start_date: str
         :param end_date: str
+        :param cursor: ScheduleCursor|None
+        :param calendar: BusinessCalendar|None
+        :return: list
+        """
+        cursor = cursor or ScheduleCursor()
+        _, dates = self.generate_posting_dates(start_date, end_date, cursor, calendar)
+        return self.create_transactions(dates, cursor.index)
+
+    def generate_dates(self, start_date, end_date, cursor: ScheduleCursor = None) -> list:
+        """
+        Scheduled dates before business day adjustment. These are what cursors track.
+
+        :param start_date: str
+        :param end_date: str
+        :param cursor: ScheduleCursor|None
+        :return: list
+        """
+        after = None if cursor is None else cursor.last_date
+        return self.date_spec.generate_scheduled_dates(start_date, end_date, after=after)
+
+    def generate_posting_dates(self, start_date, end_date, cursor: ScheduleCursor = None,
+                               calendar: BusinessCalendar = None) -> tuple:
+        """
+        Occurrences that post between start_date and end_date
+
+        A rolled occurrence belongs to the window its rolled date falls in, which need not be the window of its
+        scheduled date. Scheduled dates are generated a few days either side of the window so occurrences rolled into
+        it are found, and those rolled out of it are left for the next window.
+
+        :param start_date: str
+        :param end_date: str
+        :param cursor: ScheduleCursor|None
+        :param calendar: BusinessCalendar|None
+        :return: tuple (scheduled dates, rolled dates) of the occurrences posting in the window
+        """
+        if self.date_spec.roll is None:
+            dates = self.generate_dates(start_date, end_date, cursor)
+            return dates, dates
+        start, end = dp.parse(start_date), dp.parse(end_date)
+        padding = drel(days=ROLL_PADDING_DAYS)
+        scheduled = self.generate_dates((start - padding).strftime(DATE_FORMAT),
+                                        (end + padding).strftime(DATE_FORMAT), cursor)
+        rolled = self.date_spec.adjust(scheduled, calendar)
+        posting = [i for i, d in enumerate(rolled) if start <= d <= end]
+        return [scheduled[i] for i in posting], [rolled[i] for i in posting]
+
+    def create_transactions(self, dates: list, start_index: int = 0) -> list:
+        """
+        Create transactions for already generated dates
+
+        :param dates: list
+        :param start_index: int Index of the first date among all occurrences of this scheduled transaction
         :return: list
         """
         transactions = []
-        dates = self.date_spec.generate_dates(start_date, end_date)
-        for i, d in enumerate(dates):
+        for i, d in enumerate(dates, start=start_index):
             transactions.extend(
                 self.create_root_transaction(
                     index=i,
@@ -148,7 +304,6 @@ class ScheduledTransaction:
     @classmethod
     def create_plain_transfer(cls, *, transaction_id: str, account_id: str, name: str, ttype: str, date, amount: float,
                               transfer: Transfer) -> list:
-        transactions = []
         # determine sending and receiving account
         if transfer.direction == 'to':
             sending_account_id = account_id
@@ -158,17 +313,9 @@ class ScheduledTransaction:
             receiving_account_id = account_id
         else:
             raise ValueError(f'Transfer direction must be one of "to", "from". Received: {transfer.direction}')
-        # debit sending account
-        transactions.append(
-            Transaction(transaction_id=transaction_id, type=ttype, account_id=sending_account_id, date=date,
-                        amount=-abs(amount), name=name)
-        )
-        # credit receiving account
-        transactions.append(
-            Transaction(transaction_id=transaction_id, type=ttype, account_id=receiving_account_id, date=date,
-                        amount=abs(amount), name=name)
-        )
-        return transactions
+        # a single journal entry debits the sending account and credits the receiving account
+        return [JournalEntry(transaction_id=transaction_id, type=ttype, date=date, amount=abs(amount), name=name,
+                             from_account_id=sending_account_id, to_account_id=receiving_account_id)]
 
     @classmethod
     def create_plain_credit(cls, *, transaction_id: str, account_id: str, name: str, ttype: str, date,
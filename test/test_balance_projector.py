@@ -1,14 +1,35 @@
+import asyncio
+import copy
 import datetime
+import io
+import json
+import os
+import tempfile
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import pandas as pd
+import yaml
 from parameterized import parameterized
 
 from balance_projector.account import Account
+from balance_projector.accrual import Accrual
+from balance_projector.aggregate import Aggregate
+from balance_projector.batch import BatchProjector
+from balance_projector.busday import BusinessCalendar
+from balance_projector.checkpoint import Checkpoint
+from balance_projector.dash_app import create_chart, figure_cache, get_chart_fingerprint
 from balance_projector.datespec import DateSpec
-from balance_projector.exceptions import OutOfBoundsException
+from balance_projector.exceptions import AccountNotFoundException, AggregateNotFoundException, OutOfBoundsException
+from balance_projector.goalseek import GoalSeek, Variable, Constraint
+from balance_projector.importer import TransactionImporter
+from balance_projector.journal import EXTERNAL_ACCOUNT_ID
+from balance_projector.linear import LinearProjection
 from balance_projector.projector import Projector
+from balance_projector.rollup import Rollup
+from balance_projector.server import QueryService, QueryServer
+from balance_projector.store import ProjectionStore, hash_spec
 from balance_projector.transaction import Transaction
 from test.helpers import FixtureHelper, DebugHelper
 
@@ -78,6 +99,30 @@ class TestAccount(unittest.TestCase):
         self.assertEqual(account.get_balance('2022-01-28'), 6000)
         self.assertEqual(account.get_balance('2025-01-01'), 6000)
 
+    def test_balance_ohlc(self):
+        account = Account(account_id='checking', name='Checking', start_date='2022-01-01', balance=1000)
+        account.add_transactions([
+            Transaction(transaction_id='rent', account_id='checking',
+                        date=datetime.datetime(2022, 1, 1, 0, 0), amount=-900.0, name='Rent', type='expense'),
+            Transaction(transaction_id='car', account_id='checking',
+                        date=datetime.datetime(2022, 1, 10, 0, 0), amount=-400.0, name='Car', type='expense'),
+            Transaction(transaction_id='paycheck', account_id='checking',
+                        date=datetime.datetime(2022, 1, 10, 0, 0), amount=2000.0, name='Paycheck', type='income'),
+            Transaction(transaction_id='paycheck', account_id='checking',
+                        date=datetime.datetime(2022, 3, 15, 0, 0), amount=500.0, name='Paycheck', type='income')
+        ])
+        df = account.get_balance_ohlc('monthly')
+        self.assertEqual(list(df.index.astype(str)), ['2022-01', '2022-02', '2022-03'])
+        # the same-day car payment and paycheck net out, only end-of-day balances count
+        self.assertEqual(df.loc['2022-01'].tolist(), [1000.0, 100.0, 1700.0, 1700.0, 700.0])
+        self.assertEqual(df.loc['2022-02'].tolist(), [1700.0, 1700.0, 1700.0, 1700.0, 0.0])
+        self.assertEqual(df.loc['2022-03', 'close'], account.get_balance('2022-03-31'))
+        self.assertIs(account.get_balance_ohlc('monthly'), df)
+        account.add_transaction(Transaction(transaction_id='rent', account_id='checking',
+                                            date=datetime.datetime(2022, 2, 1, 0, 0), amount=-900.0, name='Rent',
+                                            type='expense'))
+        self.assertEqual(account.get_balance_ohlc('monthly').loc['2022-02', 'min'], 800.0)
+
 
 class TestDates(unittest.TestCase):
     @parameterized.expand([
@@ -112,7 +157,7 @@ class TestDates(unittest.TestCase):
                 ]
         ),
         (
-                # Every Month on the 30th
+                # Every Month on the 30th, the last day in February
                 "monthly_30th",
                 {
                     'start_date':   '2021-11-05',
@@ -128,17 +173,17 @@ class TestDates(unittest.TestCase):
                 },
                 [
                     datetime.datetime(2021, 11, 30, 0, 0, 0),
-                    datetime.datetime(2021, 12, 31, 0, 0, 0),
-                    datetime.datetime(2022, 1, 31, 0, 0, 0),
+                    datetime.datetime(2021, 12, 30, 0, 0, 0),
+                    datetime.datetime(2022, 1, 30, 0, 0, 0),
                     datetime.datetime(2022, 2, 28, 0, 0, 0),
-                    datetime.datetime(2022, 3, 31, 0, 0, 0),
+                    datetime.datetime(2022, 3, 30, 0, 0, 0),
                     datetime.datetime(2022, 4, 30, 0, 0, 0),
-                    datetime.datetime(2022, 5, 31, 0, 0, 0),
+                    datetime.datetime(2022, 5, 30, 0, 0, 0),
                     datetime.datetime(2022, 6, 30, 0, 0, 0),
-                    datetime.datetime(2022, 7, 31, 0, 0, 0),
-                    datetime.datetime(2022, 8, 31, 0, 0, 0),
+                    datetime.datetime(2022, 7, 30, 0, 0, 0),
+                    datetime.datetime(2022, 8, 30, 0, 0, 0),
                     datetime.datetime(2022, 9, 30, 0, 0, 0),
-                    datetime.datetime(2022, 10, 31, 0, 0, 0)
+                    datetime.datetime(2022, 10, 30, 0, 0, 0)
                 ]
         ),
         (
@@ -237,7 +282,7 @@ class TestDates(unittest.TestCase):
                 ]
         ),
         (
-                # Every Month on the 30th
+                # Every Month on the 30th, the last day in February
                 "monthly_30th_infinite",
                 {
                     'start_date':   '2021-11-05',
@@ -252,11 +297,11 @@ class TestDates(unittest.TestCase):
                     'end_date':   '2022-06-30'
                 },
                 [
-                    datetime.datetime(2022, 1, 31, 0, 0, 0),
+                    datetime.datetime(2022, 1, 30, 0, 0, 0),
                     datetime.datetime(2022, 2, 28, 0, 0, 0),
-                    datetime.datetime(2022, 3, 31, 0, 0, 0),
+                    datetime.datetime(2022, 3, 30, 0, 0, 0),
                     datetime.datetime(2022, 4, 30, 0, 0, 0),
-                    datetime.datetime(2022, 5, 31, 0, 0, 0),
+                    datetime.datetime(2022, 5, 30, 0, 0, 0),
                     datetime.datetime(2022, 6, 30, 0, 0, 0)
                 ]
         )
@@ -266,6 +311,104 @@ class TestDates(unittest.TestCase):
         actual = datespec.generate_dates(start_date=date_filter['start_date'], end_date=date_filter['end_date'])
         self.assertEqual(actual, expected)
 
+    @parameterized.expand([
+        (
+                "yearly",
+                {
+                    'start_date':   '2021-03-15',
+                    'end_date':     None,
+                    'frequency':    'yearly',
+                    'interval':     1,
+                    'day_of_week':  None,
+                    'day_of_month': 15,
+                    'month':        3
+                },
+                None,
+                {
+                    'start_date': '2022-01-01',
+                    'end_date':   '2023-12-31'
+                },
+                [
+                    datetime.datetime(2022, 3, 15, 0, 0),
+                    datetime.datetime(2023, 3, 15, 0, 0)
+                ]
+        ),
+        (
+                # second Tuesday of the month
+                "second_tuesday",
+                {
+                    'start_date':    '2021-11-05',
+                    'end_date':      None,
+                    'frequency':     'monthly',
+                    'interval':      1,
+                    'day_of_week':   'tue',
+                    'day_of_month':  None,
+                    'week_of_month': 2
+                },
+                None,
+                {
+                    'start_date': '2022-01-01',
+                    'end_date':   '2022-03-31'
+                },
+                [
+                    datetime.datetime(2022, 1, 11, 0, 0),
+                    datetime.datetime(2022, 2, 8, 0, 0),
+                    datetime.datetime(2022, 3, 8, 0, 0)
+                ]
+        ),
+        (
+                "last_business_day",
+                {
+                    'start_date':   '2021-11-05',
+                    'end_date':     None,
+                    'frequency':    'monthly',
+                    'interval':     1,
+                    'day_of_week':  None,
+                    'day_of_month': -1,
+                    'roll':         'backward'
+                },
+                {'holidays': ['2022-06-30']},
+                {
+                    'start_date': '2022-04-01',
+                    'end_date':   '2022-07-31'
+                },
+                [
+                    datetime.datetime(2022, 4, 29, 0, 0),
+                    datetime.datetime(2022, 5, 31, 0, 0),
+                    datetime.datetime(2022, 6, 29, 0, 0),
+                    datetime.datetime(2022, 7, 29, 0, 0)
+                ]
+        ),
+        (
+                "roll_forward",
+                {
+                    'start_date':   '2021-11-05',
+                    'end_date':     None,
+                    'frequency':    'monthly',
+                    'interval':     1,
+                    'day_of_week':  None,
+                    'day_of_month': 1,
+                    'roll':         'forward'
+                },
+                {'holidays': ['2022-03-01']},
+                {
+                    'start_date': '2022-01-01',
+                    'end_date':   '2022-03-31'
+                },
+                [
+                    datetime.datetime(2022, 1, 3, 0, 0),
+                    datetime.datetime(2022, 2, 1, 0, 0),
+                    datetime.datetime(2022, 3, 2, 0, 0)
+                ]
+        )
+    ])
+    def test_create_dates_calendar(self, name, spec, calendar_spec, date_filter, expected):
+        datespec = DateSpec.from_spec(spec)
+        calendar = BusinessCalendar.from_spec(calendar_spec, date_filter['start_date'], date_filter['end_date'])
+        actual = datespec.generate_dates(start_date=date_filter['start_date'], end_date=date_filter['end_date'],
+                                         calendar=calendar)
+        self.assertEqual(actual, expected)
+
 
 class TestProjector(unittest.TestCase):
 
@@ -373,6 +516,580 @@ class TestProjector(unittest.TestCase):
             ).to_numpy()
         )
 
+    def test_extend_matches_full_projection(self):
+        spec = FixtureHelper.get_spec_fixture()
+        full = Projector.from_spec(spec, '2022-01-01', '2022-12-31')
+        extended = Projector.from_spec(spec, '2022-01-01', '2022-06-30').extend('2022-12-31')
+        self.assertEqual(extended.end_date, '2022-12-31')
+        for account_id in ['checking', 'savings', 'credit_card', '401k']:
+            pd.testing.assert_frame_equal(extended.get_account(account_id).get_transactions_df(),
+                                          full.get_account(account_id).get_transactions_df())
+
+    def test_extend_requires_later_end_date(self):
+        spec = FixtureHelper.get_spec_fixture()
+        projector = Projector.from_spec(spec, '2022-01-01', '2022-06-30')
+        self.assertRaises(ValueError, projector.extend, '2022-06-30')
+
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        spec = FixtureHelper.get_spec_fixture()
+        self.projector = Projector.from_spec(spec, '2022-01-01', '2022-12-31')
+        self.accounts = self.projector.accounts
+
+    def test_transfers_recorded_once(self):
+        ledger = self.accounts.get_ledger_df()
+        transfers = ledger[ledger['type'] == 'transfer']
+        self.assertEqual(len(self.accounts.journal) * 2, len(transfers.index))
+        for account in self.accounts.accounts.values():
+            self.assertFalse(any(t.type == 'transfer' for t in account.transactions))
+        journal = self.accounts.get_journal_df()
+        self.assertTrue((journal['amount'] >= 0).all())
+        self.assertEqual((journal[['from_account_id', 'to_account_id']] == EXTERNAL_ACCOUNT_ID).any(axis=1).sum(),
+                         ledger['counterparty_id'].isna().sum())
+
+    def test_check_balanced(self):
+        self.assertEqual(len(self.accounts.check_balanced().index), 0)
+        # a transfer leg without its other side
+        self.accounts.add_transactions([Transaction(transaction_id='stray', type='transfer', account_id='checking',
+                                                    date=datetime.datetime(2022, 3, 3), amount=-50.0, name='Stray',
+                                                    counterparty_id='savings')])
+        unbalanced = self.accounts.check_balanced()
+        self.assertEqual(unbalanced['transaction_id'].tolist(), ['stray'])
+        self.assertEqual(unbalanced['net'].tolist(), [-50.0])
+
+
+class TestCheckpoint(unittest.TestCase):
+    def test_resume_from_checkpoint_matches_full_projection(self):
+        spec = FixtureHelper.get_spec_fixture()
+        full = Projector.from_spec(spec, '2022-01-01', '2022-12-31')
+        checkpoint = Checkpoint.from_dict(full.checkpoint('2022-03-10').to_dict())
+        self.assertEqual(checkpoint.cursors['credit_card']['groc'].index, 2)
+        resumed = Projector.from_checkpoint(spec, checkpoint, '2022-12-31')
+        self.assertEqual(resumed.start_date, '2022-03-11')
+        for account_id in ['checking', 'savings', 'credit_card', '401k']:
+            for d in ['2022-03-11', '2022-04-01', '2022-07-15', '2022-12-31']:
+                self.assertAlmostEqual(resumed.get_account(account_id).get_balance(d),
+                                       full.get_account(account_id).get_balance(d))
+        df = full.get_account('checking').get_transactions_df()
+        pd.testing.assert_frame_equal(resumed.get_account('checking').get_transactions_df(),
+                                      df[df['date'] > '2022-03-10'].reset_index(drop=True))
+
+
+    def test_resume_after_rolled_occurrence(self):
+        spec = FixtureHelper.get_spec_fixture()
+        spec['calendar'] = {'holidays': ['2022-07-01', '2022-07-04']}
+        spec['accounts']['checking']['scheduled_transactions']['paycheck']['date_spec']['roll'] = 'forward'
+        full = Projector.from_spec(spec, '2022-01-01', '2022-12-31')
+        # the 2022-07-01 paycheck posts on 2022-07-05, after the checkpoint
+        resumed = Projector.from_checkpoint(spec, full.checkpoint('2022-07-02'), '2022-12-31')
+        for d in ['2022-07-05', '2022-12-31']:
+            self.assertAlmostEqual(resumed.get_account('checking').get_balance(d),
+                                   full.get_account('checking').get_balance(d))
+
+
+class TestAccrual(unittest.TestCase):
+    def test_accrue_matches_loop(self):
+        flows = np.array([0, 100, 0, -50, 0, 0, 25.0])
+        factors = np.array([1.001, 1.0, 1.002, 1.0, 1.0, 1.01, 1.0])
+        balance, expected = 1000.0, []
+        for f, g in zip(flows, factors):
+            balance = (balance + f) * g
+            expected.append(balance)
+        np.testing.assert_allclose(Accrual.accrue(1000.0, flows, factors), expected)
+
+    @parameterized.expand([('daily',), ('monthly',)])
+    def test_savings_accrual(self, compounding):
+        spec = FixtureHelper.get_spec_fixture()
+        spec['accounts']['savings']['accrual'] = {'rate': 0.05, 'compounding': compounding}
+        projector = Projector.from_spec(spec, '2022-01-01', '2022-12-31')
+        savings = projector.get_account('savings')
+        accruals = savings.get_ledger_df().query("transaction_id == 'accrual'")
+        self.assertEqual(len(accruals.index), 12)
+        self.assertTrue((accruals['amount'] > 0).all())
+        # compounding on top of the bi-weekly deposits, matched by the linear projection at every month end
+        balances = projector.compile().evaluate()
+        for d in ['2022-01-31', '2022-03-15', '2022-06-30', '2022-12-31']:
+            self.assertAlmostEqual(balances.loc[d, 'savings'], savings.get_balance(d))
+        self.assertGreater(savings.get_balance('2022-12-31'), 2000 + 26 * 500)
+
+    @parameterized.expand([('daily',), ('monthly',)])
+    def test_resume_with_accrual(self, compounding):
+        spec = FixtureHelper.get_spec_fixture()
+        spec['accounts']['savings']['accrual'] = {'rate': 0.05, 'compounding': compounding}
+        full = Projector.from_spec(spec, '2022-01-01', '2022-12-31')
+        checkpoint = Checkpoint.from_dict(full.checkpoint('2022-03-15').to_dict())
+        resumed = Projector.from_checkpoint(spec, checkpoint, '2022-12-31')
+        balances = resumed.compile().evaluate()
+        for d in ['2022-03-16', '2022-03-31', '2022-07-15', '2022-12-31']:
+            expected = full.get_account('savings').get_balance(d)
+            self.assertAlmostEqual(resumed.get_account('savings').get_balance(d), expected)
+            self.assertAlmostEqual(balances.loc[d, 'savings'], expected)
+
+    def test_accrual_without_transactions(self):
+        spec = FixtureHelper.get_spec_fixture()
+        spec['accounts']['savings']['accrual'] = {'rate': 0.05, 'compounding': 'monthly'}
+        del spec['accounts']['checking']['scheduled_transactions']['savings']
+        savings = Projector.from_spec(spec, '2022-01-01', '2022-12-31').get_account('savings')
+        self.assertAlmostEqual(savings.get_balance('2022-12-31'), 2000 * (1 + 0.05 / 12) ** 12)
+
+
+class TestLinearProjection(unittest.TestCase):
+    def test_evaluate_matches_projector(self):
+        spec = FixtureHelper.get_spec_fixture()
+        projector = Projector.from_spec(spec, '2022-01-01', '2022-12-31')
+        balances = projector.compile().evaluate()
+        for account_id in ['checking', 'savings', 'credit_card', '401k']:
+            for d in ['2022-01-01', '2022-02-01', '2022-03-15', '2022-08-31', '2022-12-31']:
+                self.assertAlmostEqual(balances.loc[d, account_id], projector.get_account(account_id).get_balance(d))
+
+    def test_rolled_past_end_date(self):
+        spec = FixtureHelper.get_spec_fixture()
+        spec['calendar'] = {'holidays': ['2022-12-30']}
+        spec['accounts']['checking']['scheduled_transactions']['paycheck']['date_spec']['roll'] = 'forward'
+        projector = Projector.from_spec(spec, '2022-01-01', '2022-12-31')
+        # the 2022-12-30 paycheck rolls to 2023-01-02, outside the window
+        ledger = projector.get_account('checking').get_ledger_df()
+        self.assertLessEqual(ledger['date'].max(), pd.Timestamp('2022-12-31'))
+        balances = projector.compile().evaluate()
+        for account_id in ['checking', 'savings']:
+            self.assertAlmostEqual(balances.loc['2022-12-31', account_id],
+                                   projector.get_account(account_id).get_balance('2022-12-31'))
+        # and posts in the next window instead
+        extended = Projector.from_spec(spec, '2022-01-01', '2023-01-10').get_account('checking').get_ledger_df()
+        paychecks = extended.loc[extended['transaction_id'] == 'paycheck', 'date']
+        self.assertEqual(paychecks.iloc[-2:].dt.strftime('%Y-%m-%d').tolist(), ['2022-12-16', '2023-01-02'])
+
+    def test_compile_from_checkpoint(self):
+        spec = FixtureHelper.get_spec_fixture()
+        full = Projector.from_spec(spec, '2022-01-01', '2022-12-31')
+        resumed = Projector.from_checkpoint(spec, full.checkpoint('2022-03-10'), '2022-12-31')
+        balances = resumed.compile().evaluate()
+        for account_id in ['checking', 'savings', 'credit_card', '401k']:
+            for d in ['2022-03-11', '2022-08-31', '2022-12-31']:
+                self.assertAlmostEqual(balances.loc[d, account_id], resumed.get_account(account_id).get_balance(d))
+
+    def test_evaluate_with_amount_override(self):
+        spec = FixtureHelper.get_spec_fixture()
+        linear = LinearProjection.from_spec(spec, '2022-01-01', '2022-12-31')
+        balances = linear.evaluate({('credit_card', 'groc'): 1000, ('checking', 'savings'): 200})
+        spec['accounts']['credit_card']['scheduled_transactions']['groc']['amount'] = 1000
+        spec['accounts']['checking']['scheduled_transactions']['savings']['amount'] = 200
+        projector = Projector.from_spec(spec, '2022-01-01', '2022-12-31')
+        for account_id in ['checking', 'savings', 'credit_card']:
+            self.assertAlmostEqual(balances.loc['2022-12-31', account_id],
+                                   projector.get_account(account_id).get_balance('2022-12-31'))
+        self.assertRaises(KeyError, linear.evaluate, {('checking', 'cc_pmt'): 10})
+
+
+class TestGoalSeek(unittest.TestCase):
+    def test_largest_savings_transfer_above_min_balance(self):
+        spec = FixtureHelper.get_spec_fixture()
+        linear = LinearProjection.from_spec(spec, '2022-01-01', '2022-12-31')
+        result = GoalSeek(projection=linear,
+                          variables=[Variable.from_str('checking.savings:0:5000')],
+                          constraints=[Constraint(account_id='checking', min_balance=0)]).solve()
+        self.assertTrue(result.feasible)
+        amount = result.amounts[('checking', 'savings')]
+        self.assertGreaterEqual(linear.evaluate({('checking', 'savings'): amount})['checking'].min(), 0)
+        self.assertLess(linear.evaluate({('checking', 'savings'): amount + 0.02})['checking'].min(), 0)
+
+    def test_infeasible(self):
+        spec = FixtureHelper.get_spec_fixture()
+        linear = LinearProjection.from_spec(spec, '2022-01-01', '2022-12-31')
+        result = GoalSeek(projection=linear,
+                          variables=[Variable.from_str('checking.savings:0:5000')],
+                          constraints=[Constraint(account_id='checking', min_balance=1000000)]).solve()
+        self.assertFalse(result.feasible)
+
+
+class TestSnapshot(unittest.TestCase):
+    def test_snapshot_matches_accounts(self):
+        spec = FixtureHelper.get_spec_fixture()
+        projector = Projector.from_spec(spec, '2022-01-01', '2022-12-31')
+        snapshot = projector.get_snapshot()
+        for account_id in ['checking', 'credit_card']:
+            for d in ['2022-01-01', '2022-02-11', '2022-06-30', '2023-06-30']:
+                self.assertEqual(snapshot.get_account(account_id).get_balance(d),
+                                 projector.get_account(account_id).get_balance(d))
+        self.assertRaises(OutOfBoundsException, snapshot.get_account('checking').get_balance, '2021-12-31')
+        self.assertFalse(snapshot.get_account('checking').balances.flags.writeable)
+        # callers can't change what other readers see
+        df = snapshot.get_account('checking').get_running_balance_grouped()
+        df['balance'] = 0
+        self.assertNotEqual(snapshot.get_account('checking').get_running_balance_grouped()['balance'].iloc[-1], 0)
+
+    def test_publish_swaps_snapshot(self):
+        spec = FixtureHelper.get_spec_fixture()
+        projector = Projector.from_spec(spec, '2022-01-01', '2022-06-30')
+        before = projector.get_snapshot()
+        projector.extend('2022-12-31')
+        after = projector.get_snapshot()
+        self.assertEqual(after.version, before.version + 1)
+        self.assertEqual(after.end_date, '2022-12-31')
+        self.assertEqual(before.end_date, '2022-06-30')
+        self.assertEqual(after.get_account('checking').get_balance('2022-12-31'),
+                         projector.get_account('checking').get_balance('2022-12-31'))
+
+
+class TestStore(unittest.TestCase):
+    def test_store_round_trip(self):
+        spec = FixtureHelper.get_spec_fixture()
+        projector = Projector.from_spec(spec, '2022-01-01', '2022-12-31')
+        with tempfile.TemporaryDirectory() as tmp:
+            directory = os.path.join(tmp, 'store')
+            fingerprint = hash_spec(spec, '2022-01-01', '2022-12-31')
+            ProjectionStore.write(projector.publish(), directory, fingerprint)
+            self.assertIsNone(ProjectionStore.open(directory, 'stale'))
+            mapped = ProjectionStore.open(directory, fingerprint).get_snapshot().get_account('checking')
+            expected = projector.get_snapshot().get_account('checking')
+            for array in [mapped.balances, mapped.get_ledger_df()['amount'].to_numpy()]:
+                # zero-copy: the arrays are views of the mapped files
+                while not isinstance(array, np.memmap) and array.base is not None:
+                    array = array.base
+                self.assertIsInstance(array, np.memmap)
+            self.assertFalse(mapped.balances.flags.writeable)
+            for d in ['2022-01-01', '2022-02-11', '2022-12-31']:
+                self.assertEqual(mapped.get_balance(d), expected.get_balance(d))
+            self.assertEqual(mapped.get_ledger_df()['name'].astype(str).tolist(),
+                             expected.get_ledger_df()['name'].tolist())
+            self.assertEqual(mapped.get_running_balance_grouped()['amt_desc'].astype(str).tolist(),
+                             expected.get_running_balance_grouped()['amt_desc'].tolist())
+
+    def test_from_store_reuses_files(self):
+        spec = FixtureHelper.get_spec_fixture()
+        with tempfile.TemporaryDirectory() as tmp:
+            directory = os.path.join(tmp, 'store')
+            first = Projector.from_store(spec, '2022-01-01', '2022-06-30', directory)
+            second = Projector.from_store(spec, '2022-01-01', '2022-06-30', directory)
+            self.assertEqual(len(second.accounts.accounts), 0)
+            self.assertEqual(second.get_snapshot().get_account('checking').get_balance('2022-06-30'),
+                             first.get_account('checking').get_balance('2022-06-30'))
+            self.assertEqual(len(second.get_charts()), len(spec['chart_spec']))
+
+    def test_from_store_builds_once(self):
+        spec = FixtureHelper.get_spec_fixture()
+        with tempfile.TemporaryDirectory() as tmp:
+            directory = os.path.join(tmp, 'store')
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                projectors = list(executor.map(
+                    lambda _: Projector.from_store(copy.deepcopy(spec), '2022-01-01', '2022-06-30', directory),
+                    range(4)))
+            self.assertEqual(sum(len(p.accounts.accounts) > 0 for p in projectors), 1)
+            # replacing the store leaves files mapped by existing readers intact
+            mapped = projectors[0].get_snapshot().get_account('checking')
+            balance = mapped.get_balance('2022-06-30')
+            Projector.from_store(spec, '2022-01-01', '2022-12-31', directory)
+            self.assertEqual(mapped.get_balance('2022-06-30'), balance)
+
+
+class TestSearch(unittest.TestCase):
+    def setUp(self):
+        spec = FixtureHelper.get_spec_fixture()
+        self.projector = Projector.from_spec(spec, '2022-01-01', '2022-12-31')
+
+    def test_search_name_and_dates(self):
+        df = self.projector.search(text='RENT', start_date='2022-06-01', end_date='2022-12-31')
+        self.assertEqual(df['date'].dt.strftime('%Y-%m-%d').tolist(),
+                         ['2022-06-01', '2022-07-01', '2022-08-01', '2022-09-01', '2022-10-01', '2022-11-01',
+                          '2022-12-01'])
+        self.assertTrue((df['transaction_id'] == 'rent').all())
+        self.assertEqual(len(self.projector.search(text='rent nothing')), 0)
+
+    def test_search_matches_scan(self):
+        ledger = pd.concat([a.get_ledger_df() for a in self.projector.accounts.accounts.values()])
+        touching = (ledger['account_id'] == 'credit_card') | (ledger['counterparty_id'] == 'credit_card')
+        expected = ledger[(ledger['type'] == 'transfer') & touching & (ledger['date'] >= '2022-03-01')]
+        df = self.projector.search(type='transfer', account_id='credit_card', start_date='2022-03-01')
+        self.assertEqual(len(df), len(expected))
+        self.assertEqual(set(df['account_id']), {'checking', 'credit_card'})
+        self.assertTrue(df['date'].is_monotonic_increasing)
+
+    def test_index_built_on_first_search(self):
+        snapshot = self.projector.get_snapshot()
+        self.assertEqual(snapshot.index, {})
+        self.projector.search(text='rent')
+        index = snapshot.get_index()
+        self.projector.search(text='paycheck')
+        self.assertIs(snapshot.get_index(), index)
+
+
+class TestAggregate(unittest.TestCase):
+    def test_aggregates_match_accounts(self):
+        spec = FixtureHelper.get_spec_fixture()
+        projector = Projector.from_spec(spec, '2022-01-01', '2022-12-31')
+        snapshot = projector.get_snapshot()
+        for d in ['2022-01-01', '2022-02-11', '2022-07-04', '2022-12-31']:
+            balances = {a: projector.get_account(a).get_balance(d) for a in spec['accounts']}
+            self.assertAlmostEqual(snapshot.get_aggregate('net_worth').get_balance(d), sum(balances.values()))
+            self.assertAlmostEqual(snapshot.get_aggregate('debt').get_balance(d), -balances['credit_card'])
+        self.assertRaises(AggregateNotFoundException, snapshot.get_aggregate, 'nothing')
+        df = snapshot.get_aggregate('net_worth').get_running_balance_grouped()
+        self.assertTrue(df.index.is_unique and df.index.is_monotonic_increasing)
+        self.assertAlmostEqual(df['amount'].sum(), df['balance'].iloc[-1] - sum(a['balance'] for a in
+                                                                               spec['accounts'].values()))
+
+    def test_idle_member(self):
+        spec = FixtureHelper.get_spec_fixture()
+        del spec['accounts']['checking']['scheduled_transactions']['savings']
+        projector = Projector.from_spec(spec, '2022-01-01', '2022-06-30')
+        self.assertEqual(len(projector.get_account('savings').get_ledger_df().index), 0)
+        liquid = Aggregate.from_spec('liquid', {'type': 'liquid'}, spec['accounts'])
+        df = liquid.compute(projector.get_snapshot().accounts)
+        self.assertAlmostEqual(df['balance'].iloc[-1], projector.get_account('checking').get_balance('2022-06-30') +
+                               spec['accounts']['savings']['balance'])
+        self.assertEqual(len(projector.get_charts()), len(spec['chart_spec']))
+
+    def test_liquid_defaults(self):
+        spec = FixtureHelper.get_spec_fixture()
+        aggregate = Aggregate.from_spec('liquid', {'type': 'liquid'}, spec['accounts'])
+        self.assertEqual(aggregate.account_ids, ['checking', 'savings'])
+        self.assertRaises(AccountNotFoundException, Aggregate.from_spec, 'x', {'account_ids': ['nothing']},
+                          spec['accounts'])
+
+
+class TestFigureCache(unittest.TestCase):
+    def test_figure_cached_by_fingerprint(self):
+        spec = FixtureHelper.get_spec_fixture()
+        chart = Projector.from_spec(spec, '2022-01-01', '2022-06-30').get_charts()[0]
+        fingerprint = get_chart_fingerprint(chart)
+        self.assertEqual(fingerprint, get_chart_fingerprint(
+            Projector.from_spec(FixtureHelper.get_spec_fixture(), '2022-01-01', '2022-06-30').get_charts()[0]))
+        self.assertNotEqual(fingerprint, get_chart_fingerprint(chart, webgl_threshold=10))
+        create_chart(chart)
+        self.assertIn(fingerprint, figure_cache)
+        spec['accounts']['checking']['balance'] += 1
+        changed = Projector.from_spec(spec, '2022-01-01', '2022-06-30').get_charts()[0]
+        self.assertNotEqual(fingerprint, get_chart_fingerprint(changed))
+
+    def test_webgl_threshold(self):
+        spec = FixtureHelper.get_spec_fixture()
+        chart = Projector.from_spec(spec, '2022-01-01', '2022-06-30').get_charts()[0]
+        longest = max(len(account['df'].index) for account in chart.accounts)
+        traces = create_chart(chart, webgl_threshold=longest - 1)[0].figure['data']
+        self.assertEqual({t['type'] for t in traces}, {'scatter', 'scattergl'})
+        traces = create_chart(chart)[0].figure['data']
+        self.assertEqual({t['type'] for t in traces}, {'scatter'})
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        spec = FixtureHelper.get_spec_fixture()
+        self.projector = Projector.from_spec(spec, '2022-01-01', '2022-12-31')
+        self.service = QueryService.from_projector(self.projector)
+
+    def test_query_is_cached(self):
+        query = {'type': 'balance', 'account_id': 'checking', 'date': '2022-02-11'}
+        result = asyncio.run(self.service.query(query))
+        self.assertEqual(result['balance'], self.projector.get_account('checking').get_balance('2022-02-11'))
+        asyncio.run(self.service.query(query))
+        self.assertEqual(self.service.cache.hits, 1)
+
+    def test_query_many_isolates_errors(self):
+        results = asyncio.run(self.service.query_many([
+            {'type': 'ledger', 'account_id': 'savings', 'start_date': '2022-01-01', 'end_date': '2022-01-31',
+             'grouped': True},
+            {'type': 'balance', 'account_id': 'missing', 'date': '2022-02-11'}
+        ]))
+        self.assertEqual([r['date'] for r in results[0]['result']], ['2022-01-14', '2022-01-28'])
+        self.assertEqual(results[1]['status'], 404)
+
+    def test_http_get(self):
+        async def request():
+            server = await QueryServer(service=self.service).start(port=0)
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b'GET /balance?account_id=savings&date=2022-01-14 HTTP/1.1\r\nHost: localhost\r\n\r\n')
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+            server.close()
+            await server.wait_closed()
+            return response
+
+        head, _, body = asyncio.run(request()).partition(b'\r\n\r\n')
+        self.assertTrue(head.startswith(b'HTTP/1.1 200'))
+        self.assertEqual(json.loads(body)['balance'], 2500.0)
+
+    def test_http_post_invalid_queries(self):
+        async def request(body):
+            server = await QueryServer(service=self.service).start(port=0)
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b'POST /query HTTP/1.1\r\nHost: localhost\r\nContent-Length: %d\r\n\r\n' % len(body)
+                         + body)
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+            server.close()
+            await server.wait_closed()
+            return response
+
+        for body in [b'[1, 2]', b'"balance"', b'{"queries": 3}',
+                     b'{"type": "balance", "account_id": "checking", "date": null}']:
+            head, _, payload = asyncio.run(request(body)).partition(b'\r\n\r\n')
+            self.assertTrue(head.startswith(b'HTTP/1.1 400'), body)
+        head, _, payload = asyncio.run(request(b'{"queries": [1, {"type": "accounts"}]}')).partition(b'\r\n\r\n')
+        results = json.loads(payload)
+        self.assertEqual(results[0]['status'], 400)
+        self.assertEqual(len(results[1]['result']), 4)
+
+
+class TestRollup(unittest.TestCase):
+    def test_monthly_rollup_by_type(self):
+        spec = FixtureHelper.get_spec_fixture()
+        projector = Projector.from_spec(spec, '2022-01-01', '2022-12-31')
+        pivot = projector.get_rollup(['checking'])
+        february = pivot.loc[('checking', pd.Period('2022-02', 'M'))]
+        self.assertEqual(february['income'], 5000.0)
+        self.assertEqual(february['expense'], -1500.0)
+        self.assertAlmostEqual(february['transfer'], -1350.17 - 4 * 500)
+
+    def test_net_transfers(self):
+        spec = FixtureHelper.get_spec_fixture()
+        projector = Projector.from_spec(spec, '2022-01-01', '2022-12-31')
+        pivot = projector.get_rollup(['checking', 'savings'], Rollup(period='yearly', by='transaction_id',
+                                                                     net_transfers=True))
+        # only transfers between checking and savings are left out, payments to other accounts stay
+        self.assertEqual(sorted(pivot.columns), ['cc_pmt', 'paycheck', 'rent', 'retirement'])
+        self.assertNotIn('savings', pivot.index.get_level_values('account_id'))
+        pivot = projector.get_rollup(['checking'], Rollup(period='yearly', by='transaction_id', net_transfers=True))
+        self.assertIn('savings', pivot.columns)
+
+    def test_rollup_without_transactions(self):
+        spec = FixtureHelper.get_spec_fixture()
+        del spec['accounts']['checking']['scheduled_transactions']['savings']
+        projector = Projector.from_spec(spec, '2022-01-01', '2022-12-31')
+        for rollup in [Rollup(), Rollup(net_transfers=True)]:
+            self.assertEqual(len(projector.get_rollup(['savings'], rollup).index), 0)
+
+    def test_rollup_chart(self):
+        spec = FixtureHelper.get_spec_fixture()
+        projector = Projector.from_spec(spec, '2022-01-01', '2022-12-31')
+        chart = [c for c in projector.get_charts() if c.type == 'rollup'][0]
+        self.assertEqual([a['name'] for a in chart.accounts], ['Checking', 'Credit Card'])
+        # card payments are between the chart's accounts and left out, transfers to savings and the 401k stay
+        ledger = projector.get_account('checking').get_ledger_df()
+        external = ledger[(ledger['type'] == 'transfer') & (ledger['counterparty_id'] != 'credit_card')]
+        self.assertAlmostEqual(chart.accounts[0]['df']['transfer'].sum(), external['amount'].sum())
+        self.assertEqual(chart.accounts[1]['df']['transfer'].abs().sum(), 0)
+
+
+class TestAttribution(unittest.TestCase):
+    def test_attribution_explains_balance_change(self):
+        spec = FixtureHelper.get_spec_fixture()
+        projector = Projector.from_spec(spec, '2022-01-01', '2022-12-31')
+        checking = projector.get_account('checking')
+        attribution = projector.get_attribution('checking', '2022-03-01', '2022-05-31')
+        self.assertEqual(attribution.opening, checking.get_balance('2022-02-28'))
+        self.assertAlmostEqual(attribution.closing, checking.get_balance('2022-05-31'))
+        items = attribution.items.set_index('transaction_id')
+        self.assertEqual(items.loc['rent', 'amount'], -4500.0)
+        self.assertEqual(items.loc['rent', 'count'], 3)
+        self.assertEqual(items.loc['paycheck', 'type'], 'income')
+        waterfall = attribution.get_waterfall_df()
+        self.assertEqual(waterfall['measure'].tolist()[0], 'absolute')
+        self.assertEqual(waterfall['measure'].tolist()[-1], 'total')
+        self.assertTrue(waterfall['label'].is_unique)
+
+    def test_whole_projection(self):
+        spec = FixtureHelper.get_spec_fixture()
+        projector = Projector.from_spec(spec, '2022-01-01', '2022-06-30')
+        attribution = projector.get_attribution('credit_card')
+        self.assertEqual(attribution.opening, spec['accounts']['credit_card']['balance'])
+        self.assertAlmostEqual(attribution.closing, projector.get_account('credit_card').get_balance('2022-06-30'))
+        self.assertRaises(ValueError, projector.get_attribution, 'checking', '2022-06-30', '2022-01-01')
+
+
+class TestBatch(unittest.TestCase):
+    def test_batch_isolates_failures(self):
+        spec = FixtureHelper.get_spec_fixture()
+        with tempfile.TemporaryDirectory() as tmp:
+            specs_dir = os.path.join(tmp, 'specs')
+            output_dir = os.path.join(tmp, 'out')
+            os.makedirs(specs_dir)
+            for name in ['a', 'b']:
+                with open(os.path.join(specs_dir, f'{name}.yml'), 'w') as stream:
+                    yaml.safe_dump(spec, stream)
+            with open(os.path.join(specs_dir, 'bad.yml'), 'w') as stream:
+                yaml.safe_dump({'accounts': {'x': {'type': 'bogus'}}}, stream)
+            report = BatchProjector.from_directory(specs_dir, '2022-01-01', '2022-03-31', output_dir,
+                                                   workers=2).run()
+            self.assertEqual([r.ok for r in report.results], [True, True, False])
+            self.assertTrue(os.path.exists(os.path.join(output_dir, 'a', 'checking.csv')))
+            self.assertEqual(len(pd.read_csv(os.path.join(output_dir, 'summary.csv')).index), 3)
+
+
+class TestImporter(unittest.TestCase):
+    csv = (
+        'account_id,date,amount,name\n'
+        'checking,2022-01-01,-1500.00,Rent\n'
+        'checking,2022-01-01,-1500.00,Rent\n'
+        'checking,2022-01-14,2500.00,Paycheck\n'
+        'unknown,2022-01-14,10.00,Ignored\n'
+        'checking,2021-12-31,-5.00,Before window\n'
+        'checking,2022-01-14,2500.00,Paycheck\n'
+        'checking,2022-02-01,-1500.00,Rent\n'
+    )
+
+    def test_read_csv_deduplicates_across_chunks(self):
+        spec = FixtureHelper.get_spec_fixture()
+        importer = TransactionImporter.from_spec(spec, '2022-01-01', '2022-12-31', chunksize=2)
+        df = importer.read_csv(io.StringIO(self.csv))
+        self.assertEqual(df['name'].tolist(), ['Rent', 'Paycheck', 'Rent'])
+        self.assertEqual(df['amount'].tolist(), [-1500.0, 2500.0, -1500.0])
+        # a second file with the same rows adds nothing
+        self.assertEqual(len(importer.read_csv(io.StringIO(self.csv)).index), 0)
+
+    def test_actuals_replace_projected_before_cutoff(self):
+        spec = FixtureHelper.get_spec_fixture()
+        importer = TransactionImporter.from_spec(spec, '2022-01-01', '2022-12-31')
+        actuals = importer.read_csv(io.StringIO(self.csv))
+        projector = Projector.from_spec(spec, '2022-01-01', '2022-12-31', actuals=actuals, cutoff='2022-01-20')
+        df = projector.get_account('checking').get_transactions_df()
+        before = df[df['date'] < '2022-01-20']
+        self.assertEqual(before['name'].tolist(), ['Rent', 'Paycheck'])
+        # the 2022-02-01 rent already posted, so the projected occurrence is dropped
+        feb = df[df['date'] == '2022-02-01']
+        self.assertEqual(feb['name'].tolist(), ['Credit Card Pmt', 'Rent'])
+        # rent is only scheduled from 2022-02-01, so just the paycheck and the February rent match
+        self.assertEqual(projector.reconciliation.matches['name'].tolist(), ['Paycheck', 'Rent'])
+
+    def test_partly_posted_transfer_balances(self):
+        spec = FixtureHelper.get_spec_fixture()
+        importer = TransactionImporter.from_spec(spec, '2022-01-01', '2022-12-31')
+        # the savings side of the 2022-01-28 transfer has posted, the checking side hasn't
+        actuals = importer.read_csv(io.StringIO('account_id,date,amount,name\nsavings,2022-01-28,500.00,Savings\n'))
+        projector = Projector.from_spec(spec, '2022-01-01', '2022-12-31', actuals=actuals, cutoff='2022-01-20')
+        df = projector.get_account('checking').get_ledger_df()
+        kept = df[(df['transaction_id'] == 'savings') & (df['date'] == '2022-01-28')]
+        self.assertEqual(kept['amount'].tolist(), [-500.0])
+        self.assertTrue(kept['counterparty_id'].isna().all())
+        self.assertEqual(len(projector.accounts.check_balanced().index), 0)
+        self.assertRaises(ValueError, projector.compile)
+
+    def test_actuals_outside_window(self):
+        spec = FixtureHelper.get_spec_fixture()
+        importer = TransactionImporter.from_spec(spec, '2023-01-01', '2023-12-31')
+        actuals = importer.read_csv(io.StringIO(self.csv))
+        self.assertEqual(len(actuals.index), 0)
+        projector = Projector.from_spec(spec, '2023-01-01', '2023-12-31', actuals=actuals, cutoff='2023-01-01')
+        expected = Projector.from_spec(spec, '2023-01-01', '2023-12-31')
+        pd.testing.assert_frame_equal(projector.get_account('checking').get_transactions_df(),
+                                      expected.get_account('checking').get_transactions_df())
+
+    def test_cutoff_defaults_to_today(self):
+        spec = FixtureHelper.get_spec_fixture()
+        today = datetime.date.today()
+        start_date = (today - datetime.timedelta(days=30)).strftime('%Y-%m-%d')
+        end_date = (today + datetime.timedelta(days=90)).strftime('%Y-%m-%d')
+        importer = TransactionImporter.from_spec(spec, start_date, end_date)
+        actuals = importer.read_csv(io.StringIO(f'account_id,date,amount,name\nchecking,{start_date},-20.00,Coffee\n'))
+        projector = Projector.from_spec(spec, start_date, end_date, actuals=actuals)
+        df = projector.get_account('checking').get_transactions_df()
+        self.assertEqual(df.loc[df['date'] < pd.Timestamp(today), 'name'].tolist(), ['Coffee'])
+        self.assertGreater(len(df[df['date'] >= pd.Timestamp(today)].index), 0)
+
 
 if __name__ == "__main__":
     unittest.main()